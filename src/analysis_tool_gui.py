@@ -535,11 +535,11 @@ class MainWindow(Gtk.Window):
         layers = get_layers(G)
         num_configs = [len(self.component_lists[this_list]) for this_list in self.component_lists]
 
-        unique_component_lists = []
+        # The component lists are sorted, so equal configurations yield equal tuples
+        unique_component_lists = set()
         for root_node in self.component_lists:
             for configuration in self.component_lists[root_node]:
-                if configuration not in unique_component_lists:
-                    unique_component_lists.append(configuration)
+                unique_component_lists.add(tuple(configuration))
         self.num_unique_configurations = len(unique_component_lists)
 
         self.graph_stats.set_markup(
@@ -13,10 +13,13 @@
 # limitations under the License.
 
 # Python built-in libraries
-import math
+import bisect
+import itertools
+import random
 
 # third-party libraries
 import networkx as nx
+import numpy as np
 
 # project-specific libraries
 from graph_analysis.graph_analysis import create_graph_list, get_layers, get_node_name, \
@@ -73,9 +76,10 @@ def get_all_actions(dependency_graph, all_equipment, statistics):
                     action_vector.append(1)
                 else:
                     action_vector.append(0)
-            if action_vector not in all_list_actions:
+            # An action is known if its cost has been recorded already
+            action = list_to_int(statistics, action_vector)
+            if action not in all_actions_cost:
                 all_list_actions.append(action_vector)
-                action = list_to_int(statistics, action_vector)
                 all_actions_cost[action] = statistics["mode_costs"][get_node_name(dependency_graph,
                                                                                   m)]
                 all_actions.append(action)
@@ -85,40 +89,86 @@ def get_all_actions(dependency_graph, all_equipment, statistics):
         name_to_action_mapping
 
 
+# States and actions are bitmasks over all_equipments, the first equipment being the most
+# significant bit. The functions below work on the integers directly and never build lists.
+def has_equipment(statistics, state, index):
+    return (state >> (statistics["number_of_equipments"] - 1 - index)) & 1 == 1
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
+def get_bit_fail_probabilities(statistics):
+    # Fault probabilities indexed by bit position instead of equipment index, built once
+    if statistics.get("bit_fail_probabilities") is None:
+        statistics["bit_fail_probabilities"] = \
+            list(reversed(statistics["equipment_fail_probabilities"]))
+    return statistics["bit_fail_probabilities"]
+
+
+def get_mask_probability(statistics, mask):
+    bit_fail_probabilities = get_bit_fail_probabilities(statistics)
+    prob = 0
+    # Go from the most significant bit downwards to sum up in equipment order
+    while mask:
+        bit = mask.bit_length() - 1
+        prob += bit_fail_probabilities[bit]
+        mask ^= 1 << bit
+    return prob
+
+
+def get_all_equipments_mask(statistics):
+    return (1 << statistics["number_of_equipments"]) - 1
+
+
+# The equipments of a state with their cumulative fault probabilities, so that the defect of a
+# state can be drawn with a binary search instead of renormalizing the probabilities every time.
+# Cached per state mask
+def get_defect_sampler(statistics, state):
+    samplers = statistics.setdefault("defect_samplers", {})
+    if state not in samplers:
+        equipments = [i for i in range(statistics["number_of_equipments"])
+                      if has_equipment(statistics, state, i)]
+        cumulative = list(itertools.accumulate(statistics["equipment_fail_probabilities"][i]
+                                               for i in equipments))
+        samplers[state] = (equipments, cumulative, np.array(equipments, dtype=np.int64),
+                           np.array(cumulative))
+    return samplers[state]
+
+
+# Draw the defective equipment of a state with probability proportional to its fault probability
+def sample_defect_in_state(statistics, state):
+    equipments, cumulative, _, _ = get_defect_sampler(statistics, state)
+    i = bisect.bisect_right(cumulative, random.random() * cumulative[-1])
+    return equipments[min(i, len(equipments) - 1)]
+
+
+def sample_defects_in_state(statistics, state, size, rng):
+    _, _, equipments, cumulative = get_defect_sampler(statistics, state)
+    i = np.searchsorted(cumulative, rng.random(size) * cumulative[-1], side="right")
+    return equipments[np.minimum(i, len(equipments) - 1)]
+
+
 def list_to_int(statistics, mylist):
     my_int = 0
     for i in range(statistics["number_of_equipments"]):
-        my_int += mylist[i] * math.pow(2, (statistics["number_of_equipments"] - 1 - i))
-    return int(my_int)
+        my_int = (my_int << 1) | int(mylist[i])
+    return my_int
 
 
 def int_to_list(statistics, my_int):
-    my_int_copy = my_int
     if statistics["int_to_list_mapping"].get(my_int) is None:
-        mylist = []
-        for i in range(statistics["number_of_equipments"] - 1, -1, -1):
-            if my_int >= math.pow(2, i):
-                mylist.append(1)
-                my_int -= math.pow(2, i)
-            else:
-                mylist.append(0)
-        statistics["int_to_list_mapping"][my_int_copy] = mylist
+        mylist = [(my_int >> i) & 1 for i in range(statistics["number_of_equipments"] - 1, -1, -1)]
+        statistics["int_to_list_mapping"][my_int] = mylist
         return mylist
     else:
         return statistics["int_to_list_mapping"][my_int]
 
 
 def find_successor_prob(statistics, state, action):
-    state_vector = int_to_list(statistics, state)
-    action_vector = int_to_list(statistics, action)
-    prob1 = 0
-    prob2 = 0
-    for i in range(len(state_vector)):
-        if state_vector[i] == 1:
-            if action_vector[i] == 0:  # mode works fine
-                prob1 += statistics["equipment_fail_probabilities"][i]
-            elif action_vector[i] == 1:  # mode doesn't work
-                prob2 += statistics["equipment_fail_probabilities"][i]
+    prob1 = get_mask_probability(statistics, state & ~action)  # mode works fine
+    prob2 = get_mask_probability(statistics, state & action)  # mode doesn't work
     if prob1 + prob2 == 0:
         return 0, 0
     prob1 = prob1 / (prob1 + prob2)
@@ -127,33 +177,85 @@ def find_successor_prob(statistics, state, action):
 
 
 def find_successors(statistics, state, action):
-    state_vector = int_to_list(statistics, state)
-    action_vector = int_to_list(statistics, action)
-    successor1 = list(state_vector)  # action works
-    successor2 = list(state_vector)  # action doesn't work
-    for i in range(len(state_vector)):
-        if state_vector[i] == 1:
-            if action_vector[i] == 0:  # mode works fine
-                successor2[i] = 0
-            elif action_vector[i] == 1:  # mode doesn't work
-                successor1[i] = 0
-    return list_to_int(statistics, successor1), list_to_int(statistics, successor2)
+    successor1 = state & ~action  # action works
+    successor2 = state & action  # action doesn't work
+    return successor1, successor2
 
 
 def check_useful_action(statistics, state, action):
-    state_vector = int_to_list(statistics, state)
-    action_vector = int_to_list(statistics, action)
-    prob1 = 0
-    prob2 = 0
-    for i in range(len(state_vector)):
-        if state_vector[i] == 1:
-            if action_vector[i] == 0:  # mode works fine
-                prob2 += 1
-            elif action_vector[i] == 1:  # mode doesn't work
-                prob1 += 1
-    if prob1 == 0 or prob2 == 0:
-        return False
-    return True
+    return state & action != 0 and state & ~action != 0
+
+
+# All actions as a matrix of 64-bit words (one row per action) so that the useful actions of
+# one or many states can be found with a single vectorized pass instead of one
+# check_useful_action call per action
+def mask_to_words(statistics, mask):
+    number_of_words = max(1, (statistics["number_of_equipments"] + 63) // 64)
+    return np.array([(mask >> (64 * w)) & 0xFFFFFFFFFFFFFFFF for w in range(number_of_words)],
+                    dtype=np.uint64)
+
+
+def words_to_mask(words):
+    mask = 0
+    for w in range(len(words) - 1, -1, -1):
+        mask = (mask << 64) | int(words[w])
+    return mask
+
+
+# Expand an array of word rows into one column per bit, column b holding bit b of the mask
+def words_to_bits(statistics, words):
+    shifts = np.arange(64, dtype=np.uint64)
+    bits = (words[:, :, None] >> shifts) & np.uint64(1)
+    return bits.reshape(len(words), 64 * words.shape[1])[:, :statistics["number_of_equipments"]]
+
+
+def get_action_matrix(statistics):
+    if statistics.get("action_matrix") is None:
+        statistics["action_matrix"] = np.array(
+            [mask_to_words(statistics, action) for action in statistics["all_actions"]],
+            dtype=np.uint64).reshape(len(statistics["all_actions"]), -1)
+        # the smallest unsigned integer type that can index all actions
+        statistics["action_index_type"] = np.min_scalar_type(max(len(statistics["all_actions"]), 1))
+    return statistics["action_matrix"]
+
+
+def find_useful_action_indices(statistics, state):
+    action_matrix = get_action_matrix(statistics)
+    state_words = mask_to_words(statistics, state)
+    fails = (action_matrix & state_words).any(axis=1)  # some equipment of the state is used
+    works = (~action_matrix & state_words).any(axis=1)  # some equipment of the state is unused
+    return np.flatnonzero(fails & works).astype(statistics["action_index_type"])
+
+
+def find_useful_action_indices_batch(statistics, states, max_chunk_elements=1 << 22):
+    action_matrix = get_action_matrix(statistics)
+    if len(states) == 0:
+        return []
+    states_words = np.array([mask_to_words(statistics, state) for state in states],
+                            dtype=np.uint64).reshape(len(states), -1)
+    # Limit the size of the (states x actions x words) intermediate arrays
+    chunk_size = max(1, max_chunk_elements // action_matrix.size)
+    index_lists = []
+    for start in range(0, len(states), chunk_size):
+        chunk = states_words[start:start + chunk_size, None, :]
+        fails = (action_matrix[None, :, :] & chunk).any(axis=2)
+        works = (~action_matrix[None, :, :] & chunk).any(axis=2)
+        rows, columns = np.nonzero(fails & works)
+        columns = columns.astype(statistics["action_index_type"])
+        index_lists.extend(np.split(columns, np.searchsorted(rows, range(1, len(chunk)))))
+    return index_lists
+
+
+def get_action_costs(statistics):
+    if statistics.get("action_cost_array") is None:
+        statistics["action_cost_array"] = np.array([get_cost(statistics, action)
+                                                    for action in statistics["all_actions"]])
+    return statistics["action_cost_array"]
+
+
+def get_available_actions(statistics, state):
+    all_actions = statistics["all_actions"]
+    return [all_actions[i] for i in statistics["available_actions"][state]]
 
 
 def remove_unnecessary_nodes(graph):
@@ -167,20 +269,12 @@ def remove_unnecessary_nodes(graph):
 
 
 def is_final_state(state):
-    n = state
-    while n > 1:
-        if n % 2 == 0:
-            n = n / 2
-        else:
-            return False
-    return True
+    return state & (state - 1) == 0
 
 
 def no_possible_successors(statistics, state):
-    for action in statistics["available_actions"][state]:
-        if check_useful_action(statistics, state, action):
-            return False
-    return True
+    # available_actions only ever holds useful actions
+    return len(statistics["available_actions"][state]) == 0
 
 
 def get_action_name(statistics, action):
@@ -0,0 +1,80 @@
+# Python built-in libraries
+import struct
+
+# third-party libraries
+import numpy as np
+
+# Binary strategy file: a 32 byte header followed by the states of the strategy as big-endian
+# keys of key_size bytes in ascending order, and the index into all_actions of the action taken
+# in each of them as little-endian uint32. Big-endian keys sort like the state bitmasks, so the
+# file can be memory-mapped and searched without parsing it
+magic = b"PMCSTRAT"
+version = 1
+header_format = "<8sIIIQ4x"  # magic, version, number of equipments, key size, number of states
+header_size = struct.calcsize(header_format)
+
+
+def get_key_size(statistics):
+    return 8 * max(1, (statistics["number_of_equipments"] + 63) // 64)
+
+
+def write_binary_strategy(statistics, strategy, filename):
+    key_size = get_key_size(statistics)
+    action_indices = {action: i for i, action in enumerate(statistics["all_actions"])}
+    states = sorted(strategy)
+    with open(filename, "wb") as f:
+        f.write(struct.pack(header_format, magic, version, statistics["number_of_equipments"],
+                            key_size, len(states)))
+        f.write(b"".join(state.to_bytes(key_size, "big") for state in states))
+        f.write(np.array([action_indices[strategy[state]] for state in states],
+                         dtype="<u4").tobytes())
+
+
+# Strategy read from a binary strategy file. The states and actions stay on disk and are
+# looked up with a binary search over the memory-mapped keys
+class BinaryStrategy():
+    def __init__(self, statistics, filename):
+        with open(filename, "rb") as f:
+            file_magic, file_version, number_of_equipments, key_size, size = \
+                struct.unpack(header_format, f.read(header_size))
+        if file_magic != magic or file_version != version:
+            raise ValueError(f"{filename} is not a binary strategy file")
+        if number_of_equipments != statistics["number_of_equipments"]:
+            raise ValueError(f"{filename} is a strategy for {number_of_equipments} equipments, "
+                             f"the model has {statistics['number_of_equipments']}")
+        self.all_actions = statistics["all_actions"]
+        self.key_size = key_size
+        self.size = size
+        if size == 0:
+            self.keys = np.zeros(0, dtype=f"S{key_size}")
+            self.action_indices = np.zeros(0, dtype="<u4")
+        else:
+            self.keys = np.memmap(filename, dtype=f"S{key_size}", mode="r", offset=header_size,
+                                  shape=(size,))
+            self.action_indices = np.memmap(filename, dtype="<u4", mode="r",
+                                            offset=header_size + key_size * size, shape=(size,))
+
+    def find(self, state):
+        key = np.array(state.to_bytes(self.key_size, "big"), dtype=f"S{self.key_size}")
+        i = int(np.searchsorted(self.keys, key))
+        if i < self.size and self.keys[i] == key:
+            return i
+        return -1
+
+    def get(self, state, default=None):
+        i = self.find(state)
+        if i < 0:
+            return default
+        return self.all_actions[self.action_indices[i]]
+
+    def __getitem__(self, state):
+        i = self.find(state)
+        if i < 0:
+            raise KeyError(state)
+        return self.all_actions[self.action_indices[i]]
+
+    def __contains__(self, state):
+        return self.find(state) >= 0
+
+    def __len__(self):
+        return self.size
@@ -1,37 +1,26 @@
 # Python built-in libraries
+import concurrent.futures
 import random
 import time
+from statistics import NormalDist
 
 # third-party libraries
-from tqdm import tqdm
+import numpy as np
 
 # project-specific libraries
-from simulations import simulate_one_step_for_defect
-from base import find_successors, find_successor_prob, get_cost, int_to_list, \
-    no_possible_successors, get_action_name
-
-
-def sample_a_defect(statistics):
-    dist = statistics["equipment_fail_probabilities"]
-    sum_prob = 0
-    for prob in dist:
-        sum_prob += prob
-    for i in range(len(dist)):
-        dist[i] = dist[i] / sum_prob
-    rand = random.random()
-    i = 0
-    while rand > dist[i]:
-        rand -= dist[i]
-        i += 1
-    return i
+from binary_strategy import BinaryStrategy
+from selec import get_action_outcomes
+from base import get_cost, get_action_name, get_available_actions, \
+    get_action_matrix, get_action_costs, words_to_bits, find_successors, \
+    get_bit_fail_probabilities, get_all_equipments_mask, get_defect_sampler, \
+    sample_defects_in_state, popcount, find_useful_action_indices
 
 
 def pick_best_available_action(data, statistics, state):
-    avail_actions = statistics["available_actions"][state]
+    avail_actions = get_available_actions(statistics, state)
     action_values = []
     for action in avail_actions:
-        successor1, successor2 = find_successors(statistics, state, action)
-        prob1, prob2 = find_successor_prob(statistics, state, action)
+        successor1, successor2, prob1, prob2 = get_action_outcomes(statistics, state, action)
         value = get_cost(statistics, action)
         if data[successor1][1] != 0:
             value += prob1 * data[successor1][0] / data[successor1][1]
@@ -52,60 +41,369 @@ def pick_best_available_action(data, statistics, state):
     return avail_actions[best_index]
 
 
-def sample_initial_state(statistics, defect):
-    successors = []
-    for action in statistics["all_actions"]:
-        action_list = int_to_list(statistics, action)
-        if action_list[defect] == 1:
-            successors.append(action)
-    rand = random.randrange(len(successors))
-    return successors[rand]
+# Compile a strategy into arrays over the states it reaches from the initial modes. Node i stands
+# for state node_states[i] and takes action node_actions[i] (an index into all_actions, -1 once
+# the fault is isolated), continuing in node works[i] if the action works and in node fails[i]
+# otherwise. choose_action maps a state to the action of the strategy, or to None or 0 if the
+# strategy stops there. Stopping before the fault is isolated is reported as an error
+def compile_strategy(statistics, choose_action):
+    action_indices = {action: i for i, action in enumerate(statistics["all_actions"])}
+    node_ids = {}
+    node_states = []
+    node_actions = []
+    works = []
+    fails = []
+
+    def get_node(state):
+        if state not in node_ids:
+            node_ids[state] = len(node_states)
+            node_states.append(state)
+            node_actions.append(-1)
+            works.append(-1)
+            fails.append(-1)
+            nodes_to_compile.append(state)
+        return node_ids[state]
+
+    nodes_to_compile = []
+    initial_nodes = np.array([get_node(state) for state in statistics["all_actions"]],
+                             dtype=np.int64)
+    while nodes_to_compile:
+        state = nodes_to_compile.pop()
+        node = node_ids[state]
+        action = choose_action(state)
+        if not action:
+            # fail-safe to check if the strategy is complete: only states where the fault is
+            # isolated or no action can narrow it down further are leaves
+            if popcount(state) > 1 and len(find_useful_action_indices(statistics, state)) > 0:
+                print("Error: Strategy not complete for state: ", state)
+            continue
+        successor1, successor2 = find_successors(statistics, state, action)
+        node_actions[node] = action_indices[action]
+        works[node] = get_node(successor1)
+        fails[node] = get_node(successor2)
+
+    return {"initial_nodes": initial_nodes,
+            "node_states": node_states,
+            "node_actions": np.array(node_actions, dtype=np.int64),
+            "works": np.array(works, dtype=np.int64),
+            "fails": np.array(fails, dtype=np.int64)}
+
+
+# Index from every equipment to the modes (initial states) that contain it, built once from the
+# action bitmasks: one array of mode indices, the modes of equipment i being
+# modes[offsets[i]:offsets[i + 1]]
+def get_defect_modes(statistics):
+    if statistics.get("defect_modes") is None:
+        n = statistics["number_of_equipments"]
+        # column i holds bit n-1-i, i.e. the bits of equipment i
+        mode_bits = words_to_bits(statistics, get_action_matrix(statistics))[:, ::-1]
+        equipments, modes = np.nonzero(mode_bits.T)
+        statistics["defect_modes"] = (modes, np.searchsorted(equipments, np.arange(n + 1)))
+    return statistics["defect_modes"]
+
+
+def sample_defects(statistics, size, rng):
+    return sample_defects_in_state(statistics, get_all_equipments_mask(statistics), size, rng)
+
+
+# Draw for every defect one of the modes that contain it uniformly at random, using the defect
+# index. Returns indices into all_actions
+def sample_initial_modes(statistics, defects, rng):
+    modes, offsets = get_defect_modes(statistics)
+    counts = offsets[defects + 1] - offsets[defects]
+    picks = (rng.random(len(defects)) * counts).astype(np.int64)
+    return modes[offsets[defects] + picks]
+
+
+# Follow the compiled strategy from the given initial modes until every defect is isolated,
+# stepping all runs at once. Returns the accumulated cost of each run
+def simulate_compiled_strategy(statistics, compiled, defects, initial_modes):
+    action_matrix = get_action_matrix(statistics)
+    action_costs = get_action_costs(statistics)
+    defect_bits = statistics["number_of_equipments"] - 1 - defects
+    defect_words = defect_bits // 64
+    defect_shifts = (defect_bits % 64).astype(np.uint64)
+    nodes = compiled["initial_nodes"][initial_modes]
+    costs = np.zeros(len(defects))
+    active = np.arange(len(defects))
+    while len(active):
+        actions = compiled["node_actions"][nodes[active]]
+        active = active[actions >= 0]
+        actions = actions[actions >= 0]
+        costs[active] += action_costs[actions]
+        # The action fails if the defect is one of the equipments it uses
+        in_action = (action_matrix[actions, defect_words[active]] >> defect_shifts[active]) \
+            & np.uint64(1) == 1
+        nodes[active] = np.where(in_action, compiled["fails"][nodes[active]],
+                                 compiled["works"][nodes[active]])
+    return costs
+
+
+# Sample defects and initial modes with sample_defects and sample_initial_modes and run the
+# compiled strategy for all of them at once. Returns the initial modes and the costs of the runs
+def run_compiled_strategy(statistics, compiled, number_of_simulations, rng):
+    defects = sample_defects(statistics, number_of_simulations, rng)
+    initial_modes = sample_initial_modes(statistics, defects, rng)
+    return initial_modes, simulate_compiled_strategy(statistics, compiled, defects, initial_modes)
+
+
+# Running number, mean and sum of squared deviations of the costs per initial mode, the last
+# entry holding the statistics over all modes
+def init_running_statistics(statistics):
+    size = len(statistics["all_actions"]) + 1
+    return {"count": np.zeros(size), "mean": np.zeros(size), "m2": np.zeros(size)}
+
+
+# Merge two running statistics with the pairwise update of Chan et al., which is as stable as
+# Welford's update for one cost at a time
+def merge_running_statistics(running, other):
+    count = running["count"] + other["count"]
+    delta = other["mean"] - running["mean"]
+    running["mean"] += delta * other["count"] / np.maximum(count, 1)
+    running["m2"] += other["m2"] + delta ** 2 * running["count"] * other["count"] \
+        / np.maximum(count, 1)
+    running["count"] = count
+
+
+def update_running_statistics(running, initial_modes, costs):
+    size = len(running["count"])
+    groups = np.concatenate([initial_modes, np.full(len(costs), size - 1)])
+    costs = np.concatenate([costs, costs])
+    count = np.bincount(groups, minlength=size).astype(float)
+    mean = np.bincount(groups, weights=costs, minlength=size) / np.maximum(count, 1)
+    m2 = np.bincount(groups, weights=(costs - mean[groups]) ** 2, minlength=size)
+    merge_running_statistics(running, {"count": count, "mean": mean, "m2": m2})
+
+
+# Results per mode as {mode: [total cost, number of runs]}
+def get_results(statistics, running):
+    return {statistics["all_actions"][mode]:
+            [float(running["mean"][mode] * running["count"][mode]), int(running["count"][mode])]
+            for mode in range(len(statistics["all_actions"])) if running["count"][mode] > 0}
+
+
+# Width of the confidence interval of each mean, infinite while fewer than two runs are known
+def get_confidence_interval_widths(parameters, running):
+    z = NormalDist().inv_cdf((1 + parameters["confidence_level"]) / 2)
+    count = running["count"]
+    variance = np.divide(running["m2"], count - 1, out=np.full(len(count), np.inf),
+                         where=count > 1)
+    return 2 * z * np.sqrt(variance / np.maximum(count, 1))
+
+
+# Whether the confidence interval of each mean is narrow enough. A mode needs a minimum number of
+# runs first, as a few runs with the same cost give a width of 0
+def get_converged_modes(parameters, running):
+    widths = get_confidence_interval_widths(parameters, running)
+    return (running["count"] >= parameters["confidence_interval_min_samples"]) \
+        & (widths <= parameters["confidence_interval_width"])
+
 
+# The parts of statistics the run functions need, with their lookup tables built, so that only
+# these have to be sent to the worker processes
+evaluation_keys = ["all_actions", "number_of_equipments", "equipment_fail_probabilities",
+                   "bit_fail_probabilities", "action_matrix", "action_index_type",
+                   "action_cost_array", "defect_modes", "defect_samplers"]
 
-def simulate_a_path(data, statistics, defect):
-    state = sample_initial_state(statistics, defect)
-    init_state = state
-    acc_cost = 0
-    while len(statistics["available_actions"][state]) != 0:
-        action = pick_best_available_action(data, statistics, state)
-        state = simulate_one_step_for_defect(statistics, state, action, defect)
-        acc_cost += get_cost(statistics, action)
-    if no_possible_successors(statistics, state):
-        return acc_cost, init_state
-    # fail-safe to check if the exploration is complete
-    print("Error: Strategy not complete for state: ", state)
-    return acc_cost, init_state
 
+def get_evaluation_statistics(statistics):
+    get_action_matrix(statistics)
+    get_action_costs(statistics)
+    get_defect_modes(statistics)
+    get_bit_fail_probabilities(statistics)
+    get_defect_sampler(statistics, get_all_equipments_mask(statistics))
+    return {key: statistics[key] for key in evaluation_keys}
 
+
+# Do number_of_simulations runs of run_batch(statistics, *arguments, size, rng) in batches with
+# an RNG of its own. Runs in the worker processes
+def evaluation_worker(statistics, parameters, run_batch, arguments, number_of_simulations, seed):
+    rng = np.random.default_rng(seed)
+    running = init_running_statistics(statistics)
+    for start in range(0, number_of_simulations, parameters["evaluation_batch_size"]):
+        size = min(parameters["evaluation_batch_size"], number_of_simulations - start)
+        initial_modes, costs = run_batch(statistics, *arguments, size, rng)
+        update_running_statistics(running, initial_modes, costs)
+    return running
+
+
+# Split the runs into one shard per worker, every shard with an independent RNG stream spawned
+# from a seed drawn from random, and merge the statistics of the shards in shard order so that
+# the outcome only depends on the seed and the number of workers
+def run_evaluation(parameters, statistics, run_batch, arguments, number_of_simulations, executor):
+    workers = parameters["workers"] if executor is not None else 1
+    seeds = np.random.SeedSequence(random.getrandbits(128)).spawn(workers)
+    sizes = [number_of_simulations // workers + (i < number_of_simulations % workers)
+             for i in range(workers)]
+    if executor is None:
+        results = [evaluation_worker(statistics, parameters, run_batch, arguments, sizes[0],
+                                     seeds[0])]
+    else:
+        results = list(executor.map(evaluation_worker,
+                                    [statistics] * workers,
+                                    [parameters] * workers,
+                                    [run_batch] * workers,
+                                    [arguments] * workers,
+                                    sizes,
+                                    seeds))
+    running = init_running_statistics(statistics)
+    for result in results:
+        merge_running_statistics(running, result)
+    return running
+
+
+# Evaluate a strategy with max_num_simulations sampled runs or, if a confidence_interval_width
+# is given, in rounds of runs until the confidence interval of the average cost of every initial
+# mode that can occur is at most that wide, with at least confidence_interval_min_samples runs
+# each. Returns the running statistics
+def evaluate_runs(parameters, statistics, run_batch, arguments, max_num_simulations):
+    statistics = get_evaluation_statistics(statistics)
+    executor = None
+    if parameters["workers"] > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=parameters["workers"])
+    try:
+        if parameters["confidence_interval_width"] is None:
+            return run_evaluation(parameters, statistics, run_batch, arguments,
+                                  max_num_simulations, executor)
+        modes, _, weights = get_mode_defect_pairs(statistics)
+        possible_modes = np.unique(modes[weights > 0])
+        running = init_running_statistics(statistics)
+        while running["count"][-1] < max_num_simulations and \
+                not get_converged_modes(parameters, running)[possible_modes].all():
+            round_size = min(parameters["evaluation_batch_size"] * parameters["workers"],
+                             max_num_simulations - int(running["count"][-1]))
+            merge_running_statistics(running, run_evaluation(parameters, statistics, run_batch,
+                                                             arguments, round_size, executor))
+        return running
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def print_average(parameters, running):
+    number_of_simulations = int(running["count"][-1])
+    print("done")
+    print("Average cost for", number_of_simulations, "faults:", running["mean"][-1])
+    if parameters["confidence_interval_width"] is not None:
+        widths = get_confidence_interval_widths(parameters, running)
+        print(f"Width of the {parameters['confidence_level']:.0%} confidence interval over all "
+              f"faults:", widths[-1], "after", number_of_simulations, "simulations")
+        sampled_modes = running["count"][:-1] > 0
+        if not get_converged_modes(parameters, running)[:-1][sampled_modes].all():
+            print("Warning: the requested confidence interval width",
+                  parameters["confidence_interval_width"], "was not reached for every mode")
+
+
+# Every pair of an initial mode and a defect that can occur in it, as indices into all_actions and
+# all_equipments, with the probability that sample_defects and sample_initial_modes draw it
+def get_mode_defect_pairs(statistics):
+    modes, offsets = get_defect_modes(statistics)
+    counts = np.diff(offsets)
+    defects = np.repeat(np.arange(len(counts)), counts)
+    dist = np.array(statistics["equipment_fail_probabilities"], dtype=float)
+    weights = (dist / dist.sum() / np.maximum(counts, 1))[defects]
+    return modes, defects, weights
+
+
+# Expected cost of a compiled strategy without sampling. As the strategy is deterministic, the
+# cost of every (initial mode, defect) pair is exact, so all pairs are followed at once and
+# weighted. Returns the results per mode and per defect as {key: [weighted cost, probability]}
+# and the expected cost over all faults
+def evaluate_compiled_strategy_exactly(statistics, compiled):
+    modes, defects, weights = get_mode_defect_pairs(statistics)
+    costs = simulate_compiled_strategy(statistics, compiled, defects, modes)
+    number_of_modes = len(statistics["all_actions"])
+    mode_costs = np.bincount(modes, weights=weights * costs, minlength=number_of_modes)
+    mode_weights = np.bincount(modes, weights=weights, minlength=number_of_modes)
+    defect_costs = np.bincount(defects, weights=weights * costs,
+                               minlength=statistics["number_of_equipments"])
+    defect_weights = np.bincount(defects, weights=weights,
+                                 minlength=statistics["number_of_equipments"])
+    result = {statistics["all_actions"][mode]: [float(mode_costs[mode]), float(mode_weights[mode])]
+              for mode in range(number_of_modes) if mode_weights[mode] > 0}
+    defect_result = {defect: [float(defect_costs[defect]), float(defect_weights[defect])]
+                     for defect in range(statistics["number_of_equipments"])
+                     if defect_weights[defect] > 0}
+    return result, defect_result, float(mode_costs.sum())
+
+
+# Sampled evaluation of a compiled strategy, written to the weakness report
+def evaluate_sampled(parameters, statistics, compiled, max_num_simulations):
+    running = evaluate_runs(parameters, statistics, run_compiled_strategy, (compiled,),
+                            max_num_simulations)
+    print_average(parameters, running)
+    widths = None
+    if parameters["confidence_interval_width"] is not None:
+        widths = get_confidence_interval_widths(parameters, running)
+    export_weakness_report(parameters, statistics, get_results(statistics, running),
+                           widths=widths)
+
+
+def evaluate_exactly(parameters, statistics, compiled):
+    result, defect_result, expected_cost = evaluate_compiled_strategy_exactly(statistics, compiled)
+    print("done")
+    print("Expected cost over all faults:", expected_cost)
+    export_weakness_report(parameters, statistics, result, "Probability", defect_result)
+
+
+# The third column holds the weight of each average, i.e. the number of simulations or, for an
+# exact evaluation, the probability. defect_result adds the average cost per defect equipment and
+# widths the width of the confidence interval of each mode and over all faults
 # noinspection DuplicatedCode
-def export_weakness_report(parameters, statistics, result):
+def export_weakness_report(parameters, statistics, result, weight_name="Number of simulations",
+                           defect_result=None, widths=None):
     print(f"Write report to file {parameters['report_file']}")
     f = open(parameters["report_file"], "w")
-    f.write("Mode configuration:\tAverage cost\t:\tNumber of simulations\n")
+    if widths is None:
+        f.write("Mode configuration:\tAverage cost\t:\t" + weight_name + "\n")
+    else:
+        f.write("Mode configuration:\tAverage cost\t:\t" + weight_name + "\t:\t"
+                + f"{parameters['confidence_level']:.0%} confidence interval width\n")
+    mode_index = {mode: i for i, mode in enumerate(statistics["all_actions"])}
     for mode in result:
         f.write(get_action_name(statistics, mode) + ":\t" + str(result[mode][0] / result[mode][1])
-                + "\t:\t" + str(result[mode][1]) + "\n")
+                + "\t:\t" + str(result[mode][1]))
+        if widths is not None:
+            f.write("\t:\t" + str(widths[mode_index[mode]]))
+        f.write("\n")
+    if widths is not None:
+        f.write("\nAll faults:\t" + str(sum(cost for cost, _ in result.values())
+                                        / sum(count for _, count in result.values()))
+                + "\t:\t" + str(sum(count for _, count in result.values())) + "\t:\t"
+                + str(widths[-1]) + "\n")
+    if defect_result is not None:
+        f.write("\nDefect equipment:\tAverage cost\t:\t" + weight_name + "\n")
+        for defect in defect_result:
+            f.write(statistics["all_equipments"][defect] + ":\t"
+                    + str(defect_result[defect][0] / defect_result[defect][1])
+                    + "\t:\t" + str(defect_result[defect][1]) + "\n")
     f.close()
 
 
-# noinspection DuplicatedCode
-def evaluate_mcts_strategy(parameters, data, statistics):
+# Evaluate a compiled strategy exactly or by sampling, depending on the parameters
+def evaluate_compiled_strategy(parameters, statistics, compiled, name):
     max_num_simulations = 100000
-    total_cost = 0
-    defects = []
-    result = {}
-    print("\nStarting evaluation of MCTS strategy...")
+    if parameters["exact_evaluation"]:
+        print(f"\nStarting exact evaluation of {name} strategy...")
+        evaluate_exactly(parameters, statistics, compiled)
+        return
+    print(f"\nStarting evaluation of {name} strategy...")
     time.sleep(0.01)
-    for _ in tqdm(range(max_num_simulations)):
-        defect = sample_a_defect(statistics)
-        defects.append(defect)
-        cost, mode = simulate_a_path(data, statistics, defect)
-        if result.get(mode) is not None:
-            result[mode][0] += cost
-            result[mode][1] += 1
-        else:
-            result[mode] = [cost, 1]
-        total_cost += cost
-    print("done")
-    print("Average cost for", max_num_simulations, "faults:", total_cost / max_num_simulations)
-    export_weakness_report(parameters, statistics, result)
+    evaluate_sampled(parameters, statistics, compiled, max_num_simulations)
+
+
+def evaluate_mcts_strategy(parameters, data, statistics):
+    def choose_action(state):
+        if len(statistics["available_actions"].get(state, ())) == 0:
+            return 0
+        return pick_best_available_action(data, statistics, state)
+
+    evaluate_compiled_strategy(parameters, statistics, compile_strategy(statistics, choose_action),
+                               "MCTS")
+
+
+def evaluate_binary_strategy(parameters, statistics):
+    strategy = BinaryStrategy(statistics, parameters["evaluate_strategy_file"])
+    print("Loaded strategy for", len(strategy), "states from", parameters["evaluate_strategy_file"])
+    evaluate_compiled_strategy(parameters, statistics, compile_strategy(statistics, strategy.get),
+                               "binary")
@@ -1,54 +1,16 @@
 # Python built-in libraries
 import os
 import pathlib
-import re
-import time
 
 # third-party libraries
-from tqdm import tqdm
+import numpy as np
 
 # project-specific libraries
-from evaluate_mcts_strategy import sample_initial_state, sample_a_defect, export_weakness_report
-from simulations import simulate_one_step_for_defect
-from base import get_cost, no_possible_successors, get_action_from_string, int_to_list
-
-
-def simulate_a_path(statistics, strategy, defect):
-    state = sample_initial_state(statistics, defect)
-    init_state = state
-    acc_cost = 0
-    while len(statistics["available_actions"][state]) != 0:
-        action = strategy[state]
-        state = simulate_one_step_for_defect(statistics, state, action, defect)
-        acc_cost += get_cost(statistics, action)
-    if no_possible_successors(statistics, state):
-        return acc_cost, init_state
-    # fail-safe to check if the exploration is complete
-    print("Error: Strategy not complete for state: ", state)
-    return acc_cost, init_state
-
-
-# noinspection DuplicatedCode
-def evaluate_strategy(statistics, strategy):
-    max_num_simulations = 100000
-    total_cost = 0
-    defects = []
-    result = {}
-    print("\nStarting evaluation of prism strategy...")
-    time.sleep(0.01)
-    for _ in tqdm(range(max_num_simulations)):
-        defect = sample_a_defect(statistics)
-        defects.append(defect)
-        cost, mode = simulate_a_path(statistics, strategy, defect)
-        if result.get(mode) is not None:
-            result[mode][0] += cost
-            result[mode][1] += 1
-        else:
-            result[mode] = [cost, 1]
-        total_cost += cost
-    print("done")
-    print("Average cost for", max_num_simulations, "faults:", total_cost / max_num_simulations)
-    return result
+from evaluate_mcts_strategy import compile_strategy, evaluate_compiled_strategy
+from base import get_action_name, int_to_list
+
+# Size in bytes of the chunks of lines the PRISM output parsers read at once
+parse_chunk_size = 1 << 22
 
 
 def export_state_values(parameters, statistics, prism_state_to_state_mapping):
@@ -80,37 +42,77 @@ def generate_prism_strat(parameters, statistics, prism_state_to_state_mapping):
     mem_max = f"{int(0.6 * mem_bytes / (1024. ** 3))}g"
     # mem_max = "8g"  # uncomment to manually set the maximum memory of PRISM
 
-    command = (f"{path_of_prism}/prism/bin/prism {parameters['prism_model']} "
+    if parameters["prism_explicit"]:
+        prefix = parameters["prism_explicit_model"]
+        model = f"-importmodel {prefix}.tra,sta,lab,trew -mdp"
+    else:
+        model = parameters["prism_model"]
+    command = (f"{path_of_prism}/prism/bin/prism {model} "
                f"{parameters['props_file']} -prop 1 -explicit "
                f"-exportstrat {parameters['strategy_file']} "
                f"-exportstates {parameters['strategy_file'].split('.')[0]}_states_temp.prism "
                f"-javamaxmem {mem_max} -cuddmaxmem 8g -javastack 1g "
                f"> {parameters['prism_output']}")
     os.system(command)
-    state_file = open(parameters["strategy_file"].split(".")[0] + "_states_temp.prism", "r")
-    state_file.readline()
-    output_state_to_prism_state = {}
-    for line in state_file:
-        x = re.search(r"(\d*):\((\d*)\)", line)
-        output_state_to_prism_state[int(x.groups()[0])] = int(x.groups()[1])
-    state_file.close()
-    os.remove(parameters["strategy_file"].split(".")[0] + "_states_temp.prism")
-
-    strategy_file = open(parameters["strategy_file"], "r")
-    strategy = {}
-    for line in strategy_file:
-        x = re.search(r"(\d*):(.*)", line)
-        output_state = int(x.groups()[0])
-        prism_state = output_state_to_prism_state[output_state]
-        state = prism_state_to_state_mapping[prism_state]
-        action_string = x.groups()[1]
-        action = get_action_from_string(statistics, action_string)
-        strategy[state] = action
-    strategy_file.close()
+    states_file = parameters["strategy_file"].split(".")[0] + "_states_temp.prism"
+    output_state_to_prism_state = parse_prism_states(states_file)
+    os.remove(states_file)
+
+    output_states, action_indices = parse_prism_strategy(statistics, parameters["strategy_file"])
+    prism_states = output_state_to_prism_state[output_states]
+    all_actions = statistics["all_actions"]
+    strategy = {prism_state_to_state_mapping[prism_state]: all_actions[action_index]
+                for prism_state, action_index in zip(prism_states.tolist(),
+                                                     action_indices.tolist())}
     return strategy, output_state_to_prism_state
 
 
+# Read a text file in chunks of whole lines
+def read_line_chunks(filename, skip_header=False):
+    with open(filename, "r") as f:
+        if skip_header:
+            f.readline()
+        while True:
+            lines = f.readlines(parse_chunk_size)
+            if not lines:
+                return
+            yield "".join(lines)
+
+
+# Parse the "output state:(prism state)" lines of PRISM's -exportstates output into an array
+# that maps every output state to its prism state
+def parse_prism_states(filename):
+    pairs = [np.fromstring(chunk.replace(":(", " ").replace(")", " "), dtype=np.int64, sep=" ")
+             for chunk in read_line_chunks(filename, skip_header=True)]
+    pairs = np.concatenate(pairs + [np.zeros(0, dtype=np.int64)]).reshape(-1, 2)
+    output_state_to_prism_state = np.full(pairs[:, 0].max() + 1 if len(pairs) else 0, -1,
+                                          dtype=np.int64)
+    output_state_to_prism_state[pairs[:, 0]] = pairs[:, 1]
+    return output_state_to_prism_state
+
+
+def get_action_name_indices(statistics):
+    if statistics.get("action_name_indices") is None:
+        statistics["action_name_indices"] = {get_action_name(statistics, action): i
+                                             for i, action in enumerate(statistics["all_actions"])}
+    return statistics["action_name_indices"]
+
+
+# Parse the "output state:action name" lines of PRISM's -exportstrat output into an array of
+# output states and an array of the indices of their actions in all_actions
+def parse_prism_strategy(statistics, filename):
+    name_indices = get_action_name_indices(statistics)
+    output_states = [np.zeros(0, dtype=np.int64)]
+    action_indices = [np.zeros(0, dtype=np.int64)]
+    for chunk in read_line_chunks(filename):
+        tokens = chunk.replace(":", " ").split()
+        output_states.append(np.array(tokens[0::2], dtype=np.int64))
+        action_indices.append(np.fromiter((name_indices[name] for name in tokens[1::2]),
+                                          dtype=np.int64, count=len(tokens) // 2))
+    return np.concatenate(output_states), np.concatenate(action_indices)
+
+
 def evaluate_prism_strategy(parameters, statistics, strategy):
     if parameters["initial_state_file"] == "":
-        result = evaluate_strategy(statistics, strategy)
-        export_weakness_report(parameters, statistics, result)
+        evaluate_compiled_strategy(parameters, statistics,
+                                   compile_strategy(statistics, strategy.get), "prism")
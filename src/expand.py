@@ -1,16 +1,26 @@
 # Python built-in libraries
 import logging
+import math
+
+# third-party libraries
+import numpy as np
 
 # project-specific libraries
-from base import check_useful_action, find_successors
+from base import check_useful_action, find_successors, find_useful_action_indices, \
+    find_useful_action_indices_batch, get_available_actions, find_successor_prob, get_cost
 
 
+# Useful actions are stored as arrays of indices into statistics["all_actions"]
 def find_useful_actions(statistics, state):
-    a_list = []
-    for a in statistics["all_actions"]:
-        if check_useful_action(statistics, state, a):
-            a_list.append(a)
-    return a_list
+    return find_useful_action_indices(statistics, state)
+
+
+# Compute the useful actions of all states of a frontier that are not known yet in one pass
+def find_useful_actions_frontier(statistics, states):
+    new_states = [state for state in dict.fromkeys(states)
+                  if statistics["available_actions"].get(state) is None]
+    for state, indices in zip(new_states, find_useful_action_indices_batch(statistics, new_states)):
+        statistics["available_actions"][state] = indices
 
 
 def actions_to_add(statistics, state, available_actions):
@@ -40,9 +50,64 @@ def add_edge(mcts_graph, node1, node2):
     mcts_graph.add_edge(node1, node2)
 
 
+# Cost per bit of information an action yields about the defect, lower is better
+def get_information_cost(statistics, state, action):
+    entropy = -sum(prob * math.log2(prob)
+                   for prob in find_successor_prob(statistics, state, action) if prob > 0)
+    if entropy == 0:
+        return math.inf
+    return get_cost(statistics, action) / entropy
+
+
+# Progressive widening: a state with n visits may use its ceil(C * (n + 1) ^ alpha) actions with
+# the lowest cost per bit of information
+def count_widened_actions(mcts_stats, parameters, state):
+    return math.ceil(parameters["pw_constant"]
+                     * (mcts_stats[state][1] + 1) ** parameters["pw_exponent"])
+
+
+# statistics["widening"] holds the useful actions of a state ranked by cost per bit of
+# information and how many of them have been admitted to available_actions so far. The first
+# expansion admits the top of the ranking, every later one the next actions its visits allow,
+# next to the actions that survived trimming
+def widen_available_actions(mcts_stats, statistics, parameters, state):
+    widening = statistics["widening"].get(state)
+    if widening is None:
+        available_actions = get_available_actions(statistics, state)
+        information_costs = [get_information_cost(statistics, state, action)
+                             for action in available_actions]
+        positions = sorted(range(len(available_actions)), key=lambda i: (information_costs[i], i))
+        widening = [statistics["available_actions"][state][positions], 0]
+        statistics["widening"][state] = widening
+        statistics["available_actions"][state] = widening[0][:0]
+    ranked_actions, number_admitted = widening
+    number_of_actions = min(count_widened_actions(mcts_stats, parameters, state),
+                            len(ranked_actions))
+    if number_of_actions > number_admitted:
+        statistics["available_actions"][state] = np.concatenate(
+            (statistics["available_actions"][state],
+             ranked_actions[number_admitted:number_of_actions]))
+        widening[1] = number_of_actions
+
+
+# Queue the states of path again whose visits allow more actions than they have admitted
+def reopen_widened_states(mcts_stats, statistics, parameters, path):
+    for state in path:
+        widening = statistics["widening"].get(state)
+        if widening is not None and statistics["frontier"].is_explored(state) \
+                and widening[1] < len(widening[0]) \
+                and count_widened_actions(mcts_stats, parameters, state) > widening[1]:
+            statistics["frontier"].reopen(state)
+
+
 def mcts_expand(mcts_graph, mcts_stats, statistics, parameters, state):
-    available_actions = statistics["available_actions"][state]
+    if parameters["selection_policy"] == "pw":
+        widen_available_actions(mcts_stats, statistics, parameters, state)
+    available_actions = get_available_actions(statistics, state)
     actions = actions_to_add(statistics, state, available_actions)
+    find_useful_actions_frontier(statistics,
+                                 [successor for action in actions
+                                  for successor in find_successors(statistics, state, action)])
     for action in actions:
         if check_useful_action(statistics, state, action):
             successor1, successor2 = find_successors(statistics, state, action)
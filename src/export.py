@@ -1,13 +1,13 @@
 # Python built-in libraries
+import collections
 import re
 
-# third-party libraries
-import networkx as nx
-
 # project-specific libraries
+from binary_strategy import write_binary_strategy
 from evaluate_mcts_strategy import pick_best_available_action
 from base import remove_unnecessary_nodes, int_to_list, find_successors, find_successor_prob, \
-    get_action_name, no_possible_successors, get_cost, list_to_int
+    get_action_name, no_possible_successors, get_cost, list_to_int, popcount, \
+    get_available_actions
 
 
 def export_mcts_strategy(graph, data, statistics, parameters):
@@ -25,106 +25,61 @@ def export_mcts_strategy(graph, data, statistics, parameters):
             strategy[node] = action
             f.write(str(node) + " : " + str(action) + "\n")
     f.close()
+    write_binary_strategy(statistics, strategy, parameters["binary_strategy_file"])
     return strategy
 
 
 def isolated_completely(statistics, state):
-    j = 0
-    for i in int_to_list(statistics, state):
-        if i == 1:
-            j += 1
-    if j > 1:
-        return False
-    return True
+    return popcount(state) <= 1
+
+
+# Size of the write buffer of the exporters, so that large graphs go to disk in big chunks
+write_buffer_size = 1 << 20
+
+
+# States reachable from the initial states under the strategy in breadth-first order, each one
+# once. States without a strategy entry are leaves
+def strategy_states(statistics, strategy):
+    visited = set(statistics["initial_states"])
+    queue = collections.deque(dict.fromkeys(statistics["initial_states"]))
+    while queue:
+        state = queue.popleft()
+        yield state
+        if state in strategy and not no_possible_successors(statistics, state):
+            for successor in find_successors(statistics, state, strategy[state]):
+                if successor not in visited:
+                    visited.add(successor)
+                    queue.append(successor)
 
 
 def export_strategy_graph(mcts_graph, statistics, strategy, filename):
     print("Exporting graph to file:", filename)
-    nx.drawing.nx_pydot.write_dot(mcts_graph, filename)
-
-    model_file = open(filename, "w")
-    model_file.write("strict digraph {\n")
-
-    nodes_to_output = []
-    for state in statistics["initial_states"]:
-        nodes_to_output.append(state)
-    nodes_outputted = []
-    while nodes_to_output:
-        state = nodes_to_output[0]
-        nodes_to_output.remove(state)
-        if state in strategy.keys():
-            action = strategy[state]
-            action_name = get_action_name(statistics, action)
-            model_file.write("\t\"" + str(int_to_list(statistics, state)) + "\" [URL=\""
-                             + str(int_to_list(statistics, state)) + "\\n" + action_name + "\"];\n")
-        else:
-            if isolated_completely(statistics, state):
-                model_file.write("\t\"" + str(int_to_list(statistics, state))
-                                 + "\" [style=filled, fillcolor=lightgreen, URL=\""
-                                 + str(int_to_list(statistics, state)) + "\\n" + "Done" + "\"];\n")
+    states = list(strategy_states(statistics, strategy))
+    labels = {state: str(int_to_list(statistics, state)) for state in states}
+
+    with open(filename, "w", buffering=write_buffer_size) as model_file:
+        model_file.write("strict digraph {\n")
+        for state in states:
+            label = labels[state]
+            if state in strategy:
+                action_name = get_action_name(statistics, strategy[state])
+                model_file.write(f"\t\"{label}\" [URL=\"{label}\\n{action_name}\"];\n")
+            elif isolated_completely(statistics, state):
+                model_file.write(f"\t\"{label}\" [style=filled, fillcolor=lightgreen, "
+                                 f"URL=\"{label}\\nDone\"];\n")
             else:
-                model_file.write("\t\"" + str(int_to_list(statistics, state))
-                                 + "\" [style=filled, fillcolor=lightcoral, URL=\""
-                                 + str(int_to_list(statistics, state)) + "\\n" + "Deadlock"
-                                 + "\"];\n")
-        if not no_possible_successors(statistics, state):
-            successor1, successor2 = find_successors(statistics, state, action)
-            if successor1 not in nodes_outputted:
-                nodes_to_output.append(successor1)
-            if successor2 not in nodes_outputted:
-                nodes_to_output.append(successor2)
-        nodes_outputted.append(state)
-    # for state in mcts_graph.nodes:
-    #     if state == 0:
-    #         continue
-    #     if state in strategy.keys():
-    #         action = strategy[state]
-    #         action_name = get_action_name(statistics, action)
-    #         model_file.write("\t\"" + str(int_to_list(statistics, state)) + "\" [URL=\""
-    #                          + str(int_to_list(statistics, state)) + "\\n"+ action_name
-    #                          + "\"];\n")
-    #     else:
-    #         model_file.write("\t\"" + str(int_to_list(statistics, state)) + "\" [URL=\""
-    #                          + str(int_to_list(statistics, state)) + "\\n" + "Done" + "\"];\n")
-    nodes_to_output = []
-    for state in statistics["initial_states"]:
-        nodes_to_output.append(state)
-    nodes_outputted = []
-    while nodes_to_output:
-        state = nodes_to_output[0]
-        nodes_to_output.remove(state)
-        if state == 0 or no_possible_successors(statistics, state):
-            continue
-        if state in strategy.keys():
-            action = strategy[state]
-            successor1, successor2 = find_successors(statistics, state, action)
-            action_name = get_action_name(statistics, action)
-            model_file.write("\t\"" + str(int_to_list(statistics, state)) + "\"->\""
-                             + str(int_to_list(statistics, successor1)) + "\" [label=\""
-                             + action_name + " Yes\"];\n")
-            model_file.write("\t\"" + str(int_to_list(statistics, state)) + "\"->\""
-                         + str(int_to_list(statistics, successor2)) + "\" [label=\""
-                         + action_name + " No\"];\n")
-            if not no_possible_successors(statistics, state):
-                if successor1 not in nodes_outputted:
-                    nodes_to_output.append(successor1)
-                if successor2 not in nodes_outputted:
-                    nodes_to_output.append(successor2)
-        nodes_outputted.append(state)
-    # for state in mcts_graph.nodes:
-    #     if state == 0 or no_possible_successors(statistics, state):
-    #         continue
-    #     action = strategy[state]
-    #     successor1, successor2 = find_successors(statistics, state, action)
-    #     action_name = get_action_name(statistics, action)
-    #     model_file.write("\t\"" + str(int_to_list(statistics, state)) + "\"->\""
-    #                      + str(int_to_list(statistics, successor1)) + "\" [label=\""
-    #                      + action_name + " Yes\"];\n")
-    #     model_file.write("\t\"" + str(int_to_list(statistics, state)) + "\"->\""
-    #                      + str(int_to_list(statistics, successor2)) + "\" [label=\""
-    #                      + action_name + " No\"];\n")
-    model_file.write("}\n")
-    model_file.close()
+                model_file.write(f"\t\"{label}\" [style=filled, fillcolor=lightcoral, "
+                                 f"URL=\"{label}\\nDeadlock\"];\n")
+        for state in states:
+            if state == 0 or state not in strategy or no_possible_successors(statistics, state):
+                continue
+            action_name = get_action_name(statistics, strategy[state])
+            successor1, successor2 = find_successors(statistics, state, strategy[state])
+            model_file.write(f"\t\"{labels[state]}\"->\"{labels[successor1]}\" "
+                             f"[label=\"{action_name} Yes\"];\n"
+                             f"\t\"{labels[state]}\"->\"{labels[successor2]}\" "
+                             f"[label=\"{action_name} No\"];\n")
+        model_file.write("}\n")
 
 
 def vector_to_string(statistics, state, all_equip):
@@ -157,16 +112,6 @@ def vector_to_primed_string(statistics, state, all_equip):
     return state_string
 
 
-def get_prism_state(state_to_prism_state_mapping, prism_state_to_state_mapping, state):
-    if state_to_prism_state_mapping.get(state) is None:
-        prism_state = len(state_to_prism_state_mapping)
-        state_to_prism_state_mapping[state] = prism_state
-        prism_state_to_state_mapping[prism_state] = state
-    else:
-        prism_state = state_to_prism_state_mapping[state]
-    return prism_state
-
-
 def get_state_from_file(statistics, filename):
     f = open(filename, "r")
     text = f.read()
@@ -181,90 +126,135 @@ def get_state_from_file(statistics, filename):
 
 
 def export_prism_file(mcts_graph, parameters, statistics):
-    # initial stuff
-    model_file = open(parameters["prism_model"], "w")
-    model_file.write("mdp\n\n")
-    model_file.write("module mcts\n\n")
-    state_to_prism_state_mapping = {}
-    prism_state_to_state_mapping = {}
-
-    # add variables
-    model_file.write("\ts: [0.." + str(len(mcts_graph.nodes) - 1) + "];\n\n")
-
-    # and transitions and compute the actions which are used in the graph
-    used_actions = []
+    # PRISM states are numbered in the order the states are first written
+    prism_states = {}
+
+    def get_prism_state(state):
+        return prism_states.setdefault(state, len(prism_states))
+
+    with open(parameters["prism_model"], "w", buffering=write_buffer_size) as model_file:
+        # initial stuff and variables
+        model_file.write(f"mdp\n\nmodule mcts\n\n\ts: [0..{len(mcts_graph.nodes) - 1}];\n\n")
+
+        # and transitions and compute the actions which are used in the graph
+        used_actions = {}
+        for state in mcts_graph.nodes:
+            if state == 0:
+                continue
+            prism_state = get_prism_state(state)
+            for action in get_available_actions(statistics, state):
+                used_actions[action] = None
+                successor1, successor2 = find_successors(statistics, state, action)
+                prism_successor1 = get_prism_state(successor1)
+                prism_successor2 = get_prism_state(successor2)
+                prob1, prob2 = find_successor_prob(statistics, state, action)
+                model_file.write(f"\t[{get_action_name(statistics, action)}] (s={prism_state}) -> "
+                                 f"{prob1}:(s'={prism_successor1}) + "
+                                 f"{prob2}:(s'={prism_successor2});\n")
+        model_file.write("endmodule\n")
+
+        # label
+        leaf_nodes = [state for state in mcts_graph.nodes
+                      if state != 0 and no_possible_successors(statistics, state)]
+        model_file.write("\nlabel \"final\" = "
+                         + " | ".join(f"(s={get_prism_state(state)})" for state in leaf_nodes)
+                         + ";\n")
+
+        # rewards
+        model_file.write("\nrewards \"cost\"\n")
+        for action in used_actions:
+            model_file.write(f"\t[{get_action_name(statistics, action)}] true : "
+                             f"{get_cost(statistics, action)};\n")
+        model_file.write("endrewards\n")
+
+        # init states
+        if parameters["initial_state_file"] != "":
+            initial_states = [get_state_from_file(statistics, parameters["initial_state_file"]),
+                              statistics["all_actions"][-1]]
+        else:
+            initial_states = statistics["all_actions"]
+        model_file.write("\ninit\n\t"
+                         + " | ".join(f"(s={get_prism_state(state)})" for state in initial_states)
+                         + "\nendinit")
+
+    # property
+    prop_file = open(parameters["props_file"], "w")
+    prop_file.write("Rmin=? [ F \"final\" ]")
+    prop_file.close()
+
+    return {prism_state: state for state, prism_state in prism_states.items()}
+
+
+# Write the model of export_prism_file in PRISM's explicit format (.tra, .sta, .lab and .trew
+# files next to each other) so that PRISM can load it with -importmodel instead of parsing and
+# building the modelling language. States are numbered as in export_prism_file
+def export_prism_explicit_files(mcts_graph, parameters, statistics):
+    prism_states = {}
+
+    def get_prism_state(state):
+        return prism_states.setdefault(state, len(prism_states))
+
+    # the choices as (prism state, action, [(prism successor, probability), ...])
+    choices = []
     for state in mcts_graph.nodes:
         if state == 0:
             continue
-        prism_state = get_prism_state(state_to_prism_state_mapping,
-                                      prism_state_to_state_mapping,
-                                      state)
-        actions = statistics["available_actions"][state]
-        for action in actions:
-            if action not in used_actions:
-                used_actions.append(action)
+        prism_state = get_prism_state(state)
+        for action in get_available_actions(statistics, state):
             successor1, successor2 = find_successors(statistics, state, action)
-            prism_successor1 = get_prism_state(state_to_prism_state_mapping,
-                                               prism_state_to_state_mapping,
-                                               successor1)
-            prism_successor2 = get_prism_state(state_to_prism_state_mapping,
-                                               prism_state_to_state_mapping,
-                                               successor2)
             prob1, prob2 = find_successor_prob(statistics, state, action)
-            action_name = get_action_name(statistics, action)
-            model_file.write("\t[" + action_name + "] (s=" + str(prism_state) + ") -> "
-                             + str(prob1) + ":(s'=" + str(prism_successor1) + ") + " + str(prob2)
-                             + ":(s'=" + str(prism_successor2) + ");\n")
-    model_file.write("endmodule\n")
-
-    # label
-    leaf_nodes = []
-    for state in mcts_graph.nodes:
-        if state != 0 and no_possible_successors(statistics, state):
-            leaf_nodes.append(state)
-    model_file.write("\nlabel \"final\" = ")
-    for state in leaf_nodes[:-1]:
-        prism_state = get_prism_state(state_to_prism_state_mapping,
-                                      prism_state_to_state_mapping,
-                                      state)
-        model_file.write("(s=" + str(prism_state) + ") | ")
-    prism_state = get_prism_state(state_to_prism_state_mapping,
-                                  prism_state_to_state_mapping,
-                                  leaf_nodes[-1])
-    model_file.write("(s=" + str(prism_state) + ");\n")
-
-    # rewards
-    model_file.write("\nrewards \"cost\"\n")
-    for action in used_actions:
-        action_name = get_action_name(statistics, action)
-        action_cost = get_cost(statistics, action)
-        model_file.write("\t[" + action_name + "] true : " + str(action_cost) + ";\n")
-    model_file.write("endrewards\n")
-
-    # init states
-    model_file.write("\ninit\n\t")
+            transitions = [(get_prism_state(successor1), prob1),
+                           (get_prism_state(successor2), prob2)]
+            choices.append((prism_state, action, [(prism_successor, prob)
+                                                  for prism_successor, prob in transitions
+                                                  if prob > 0]))
+    final_states = [get_prism_state(state) for state in mcts_graph.nodes
+                    if state != 0 and no_possible_successors(statistics, state)]
     if parameters["initial_state_file"] != "":
-        state = get_state_from_file(statistics, parameters["initial_state_file"])
-        prism_state = get_prism_state(state_to_prism_state_mapping,
-                                      prism_state_to_state_mapping,
-                                      state)
-        model_file.write("(s=" + str(prism_state) + ") | ")
+        initial_states = [get_state_from_file(statistics, parameters["initial_state_file"]),
+                          statistics["all_actions"][-1]]
     else:
-        for state in statistics["all_actions"][:-1]:
-            prism_state = get_prism_state(state_to_prism_state_mapping,
-                                          prism_state_to_state_mapping,
-                                          state)
-            model_file.write("(s=" + str(prism_state) + ") | ")
-    prism_state = get_prism_state(state_to_prism_state_mapping,
-                                  prism_state_to_state_mapping,
-                                  statistics["all_actions"][-1])
-    model_file.write("(s=" + str(prism_state) + ")\n")
-    model_file.write("endinit")
-    model_file.close()
+        initial_states = statistics["all_actions"]
+    initial_states = [get_prism_state(state) for state in initial_states]
+    # the transitions of a state have to be listed together, ordered by the choices
+    choices.sort(key=lambda choice: choice[0])
+
+    prefix = parameters["prism_explicit_model"]
+    number_of_transitions = sum(len(transitions) for _, _, transitions in choices)
+    number_of_rewards = sum(len(transitions) for _, action, transitions in choices
+                            if get_cost(statistics, action) != 0)
+    with open(prefix + ".tra", "w", buffering=write_buffer_size) as tra_file, \
+            open(prefix + ".trew", "w", buffering=write_buffer_size) as trew_file:
+        tra_file.write(f"{len(prism_states)} {len(choices)} {number_of_transitions}\n")
+        trew_file.write(f"{len(prism_states)} {len(choices)} {number_of_rewards}\n")
+        choice = 0
+        for i, (prism_state, action, transitions) in enumerate(choices):
+            choice = choice + 1 if i > 0 and choices[i - 1][0] == prism_state else 0
+            action_name = get_action_name(statistics, action)
+            action_cost = get_cost(statistics, action)
+            for prism_successor, prob in transitions:
+                tra_file.write(f"{prism_state} {choice} {prism_successor} {prob} {action_name}\n")
+                if action_cost != 0:
+                    trew_file.write(f"{prism_state} {choice} {prism_successor} {action_cost}\n")
+
+    with open(prefix + ".sta", "w", buffering=write_buffer_size) as sta_file:
+        sta_file.write("(s)\n")
+        for prism_state in range(len(prism_states)):
+            sta_file.write(f"{prism_state}:({prism_state})\n")
+
+    labels = {}
+    for prism_state in initial_states:
+        labels.setdefault(prism_state, set()).add(0)
+    for prism_state in final_states:
+        labels.setdefault(prism_state, set()).add(1)
+    with open(prefix + ".lab", "w", buffering=write_buffer_size) as lab_file:
+        lab_file.write("0=\"init\" 1=\"final\"\n")
+        for prism_state in sorted(labels):
+            lab_file.write(f"{prism_state}: {' '.join(map(str, sorted(labels[prism_state])))}\n")
 
     # property
     prop_file = open(parameters["props_file"], "w")
     prop_file.write("Rmin=? [ F \"final\" ]")
     prop_file.close()
 
-    return prism_state_to_state_mapping
+    return {prism_state: state for state, prism_state in prism_states.items()}
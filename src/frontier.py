@@ -0,0 +1,123 @@
+# Python built-in libraries
+import random
+
+
+# Set with O(1) insertion, removal, membership and access by index. Removing an item moves the
+# last item into its slot, so the order of the items is not preserved
+class IndexedSet():
+    def __init__(self, items=()):
+        self.items = []
+        self.positions = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def remove(self, item):
+        position = self.positions.pop(item)
+        last_item = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last_item
+            self.positions[last_item] = position
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+
+# States the MCTS still has to expand and states it has expanded already. The states are also
+# kept in a tree of the state each one was queued from, which counts the queued states below
+# every state, so that a selection can walk down from an initial state to a queued state
+class Frontier():
+    def __init__(self):
+        self.nodes_to_explore = IndexedSet()
+        self.nodes_explored = IndexedSet()
+        self.parents = {}
+        self.children = {}
+        self.queued_below = {}
+
+    # Queue a state unless it is queued or has been explored already. Returns True if queued
+    def add(self, state, parent=None):
+        if state in self.nodes_to_explore or state in self.nodes_explored:
+            return False
+        self.link(state, parent)
+        self.nodes_to_explore.add(state)
+        self.count_queued(state, 1)
+        return True
+
+    # Queue a state even if it has been explored before, e.g. an initial state
+    def reopen(self, state):
+        if state not in self.nodes_to_explore:
+            self.nodes_to_explore.add(state)
+            self.count_queued(state, 1)
+
+    def remove(self, state):
+        self.nodes_to_explore.remove(state)
+        self.count_queued(state, -1)
+
+    def mark_explored(self, state):
+        self.remove(state)
+        self.nodes_explored.add(state)
+
+    # Attach a state to the state it is queued from, a state queued again may have a new parent
+    def link(self, state, parent):
+        old_parent = self.parents.pop(state, None)
+        if old_parent is not None:
+            self.children[old_parent].remove(state)
+        if parent is not None:
+            self.parents[state] = parent
+            if parent not in self.children:
+                self.children[parent] = IndexedSet()
+            self.children[parent].add(state)
+
+    # Successors have fewer suspect equipments than their parent, so the walk always ends
+    def count_queued(self, state, change):
+        while state is not None:
+            self.queued_below[state] = self.queued_below.get(state, 0) + change
+            state = self.parents.get(state)
+
+    # Children of a state with queued states in their subtree
+    def open_children(self, state):
+        return [child for child in self.children.get(state, ())
+                if self.queued_below.get(child, 0) > 0]
+
+    # Take over the states of another frontier. A state explored in either frontier is explored
+    def merge(self, other):
+        for state, parent in other.parents.items():
+            if state not in self.parents:
+                self.link(state, parent)
+        for state in other.nodes_explored:
+            if state in self.nodes_to_explore:
+                self.nodes_to_explore.remove(state)
+            self.nodes_explored.add(state)
+        for state in other.nodes_to_explore:
+            if state not in self.nodes_explored:
+                self.nodes_to_explore.add(state)
+        self.queued_below = {}
+        for state in self.nodes_to_explore:
+            self.count_queued(state, 1)
+
+    def is_explored(self, state):
+        return state in self.nodes_explored
+
+    def pick_random(self):
+        return self.nodes_to_explore[random.randrange(len(self.nodes_to_explore))]
+
+    @property
+    def size(self):
+        return len(self.nodes_to_explore)
+
+    @property
+    def explored_count(self):
+        return len(self.nodes_explored)
@@ -16,39 +16,61 @@
 
 # third-party libraries
 import networkx as nx
+import numpy as np
 
 # Python built-in libraries
 import itertools
 import re
 import logging
 import concurrent.futures
-import time
+import collections
 import math
+import os
 from functools import reduce
 from operator import mul
 
 
-# Collect results of the threads started by create_graphs_mode
+# Collect the graphs built by create_graph_permutation. A graph is only added if its node list is
+# new: we assume that the node list suffices to identify the graph. This might not cover systems
+# where components are used for multiple functions
 class PermutationFetcher():
     def __init__(self, all_permutations):
         self.all_permutations = all_permutations
         self.graph_list = []
         self.node_lists = []
         self.computed_permutations = 0
+        self.permutations = []
+        self.known_node_lists = set()
+        self.duplicates = 0
+
+    # Count node_list as a duplicate if a graph with the same node list has been added already
+    def is_duplicate(self, node_list):
+        if frozenset(node_list) in self.known_node_lists:
+            self.duplicates += 1
+            self.computed_permutations += 1
+            return True
+        return False
 
-    def add_permutation(self, root_node, graph, node_list):
+    def add_permutation(self, root_node, graph, node_list, permutation):
+        self.known_node_lists.add(frozenset(node_list))
         self.graph_list.append(graph)
         self.node_lists.append(node_list)
+        self.permutations.append(permutation)
         self.computed_permutations += 1
 
-    def get_done(self):
-        return self.computed_permutations == self.all_permutations
+    # Add the graphs of another fetcher, e.g. one filled by a worker process
+    def extend(self, graph_list, node_lists, permutations, duplicates):
+        for graph, node_list, permutation in zip(graph_list, node_lists, permutations):
+            if not self.is_duplicate(node_list):
+                self.add_permutation(None, graph, node_list, permutation)
+        self.duplicates += duplicates
+        self.computed_permutations += duplicates
 
     def get_graph_lists(self):
-        return self.graph_list, self.node_lists
+        return self.graph_list, self.node_lists, self.permutations
 
 
-# Collect results of the threads started by create_graph_list
+# Collect the results of create_graph_list_mode for every mode
 class GraphListFetcher():
     def __init__(self, number_of_root_nodes):
         self.unique_graph_list = {}
@@ -75,9 +97,6 @@ class GraphListFetcher():
     def skip(self):
         self.number_of_computed_root_nodes += 1
 
-    def get_done(self):
-        return self.number_of_computed_root_nodes == self.number_of_root_nodes
-
     def get_graph_lists(self):
         return self.unique_graph_list, self.unique_node_lists, self.component_lists, \
             self.configuration_list, self.configuration_space
@@ -106,11 +125,15 @@ def get_node_id(graph, name):
 
 # Create a new graph that only contains the passed nodes
 def get_subgraph(graph, node_list):
-    # Copy the graph and remove all nodes not belonging to node_list to yield a subgraph
-    subgraph = graph.copy()
-    for node in graph:
-        if node not in node_list:  # graph must contain all nodes specified in node_list
-            subgraph.remove_node(node)
+    # Copy the nodes and edges belonging to node_list in the order of graph, which yields the same
+    # graph as copying graph and removing all other nodes, without touching the removed nodes
+    node_set = set(node_list)
+    subgraph = graph.__class__()
+    subgraph.graph.update(graph.graph)
+    subgraph.add_nodes_from((node, attr) for node, attr in graph.nodes(data=True)
+                            if node in node_set)
+    subgraph.add_edges_from((u, v, attr) for u, v, attr in graph.edges(data=True)
+                            if u in node_set and v in node_set)
     return subgraph
 
 
@@ -257,98 +280,84 @@ def create_configuration_space(graph, layers):
     return configurations, configuration_space, number_of_permutations
 
 
-# List of all members of the configuration space
-def create_permutations(configurations):  # compute all valid configurations for the graph
-    # Every permutation is a dict containing assemblies as keys and their configurations as values
-    permutations = []
-    for assembly in configurations:
-        if not permutations:  # create the first entry
-            # The permutation list is empty, so we create the first one as a copy of the current
-            # assembly
-            for configuration in configurations[assembly]:
-                permutations.append({assembly: configuration})
-        else:
-            # Multiplicate the number of permutations found so far with the number of configurations
-            # in this assembly by using a nested for-loop and replacing permutations with
-            # new_permutations
-            new_permutations = []
-            for permutation in permutations:
-                for configuration in configurations[assembly]:
-                    # For every possible configuration that an assembly can have, we copy
-                    # the existing permutation and add the new configuration to it
-                    new_permutation = permutation.copy()
-                    new_permutation[assembly] = configuration
-                    new_permutations.append(new_permutation)
-            permutations = new_permutations
-    if not permutations:  # If there is only one configuration, add a dummy item
-        permutations.append({})
-    return permutations
-
-
-# Prune duplicate configurations
-def remove_duplicates(graph_list, node_lists, permutations, root_node):  # prune duplicates
-    unique_graph_list = []
-    unique_node_lists = []
-    configuration_list = []
-    counter = 0
-    for graph, node_list, permutation in zip(graph_list, node_lists, permutations):
-        # Check if the graph is known already. We assume that the node_list suffices to identify
-        # the graph. This might not cover systems where components are used for multiple functions
-        if node_list not in unique_node_lists:
-            unique_graph_list.append(graph)
-            unique_node_lists.append(node_list)
-            configuration_list.append(permutation)
-        else:  # if the graph is known already, do not add it to the list of unique graphs
-            counter += 1
-    if counter:
-        logging.info(f"[{get_node_name(graph_list[0], root_node)}] Deleted {counter} duplicate "
-                     f"graphs")
-    return unique_graph_list, unique_node_lists, configuration_list
+# Lazily enumerate the configuration space as tuples holding one configuration index per assembly.
+# The first assembly changes slowest. Without any assembly, the single empty tuple stands for the
+# only configuration of the graph
+def iterate_permutation_indices(configurations):
+    return itertools.product(*[range(len(configurations[assembly]))
+                               for assembly in configurations])
+
+
+# Expand a tuple of configuration indices into a permutation dict
+def get_permutation(configurations, indices):
+    return {assembly: configurations[assembly][index]
+            for assembly, index in zip(configurations, indices)}
+
+
+# Yield the members of the configuration space one at a time, so that they can be fed to
+# create_graph_permutation without keeping the whole configuration space in memory. Every
+# permutation is a dict containing assemblies as keys and their configurations as values
+def iterate_permutations(configurations):
+    for indices in iterate_permutation_indices(configurations):
+        yield get_permutation(configurations, indices)
+
+
+# Precompute the node sets that create_graph_permutation combines for every permutation of a
+# mode: for every successor of an assembly, the nodes reachable from it without passing another
+# disjunctive node, and everything below the invariant nodes such a branch can reach
+def create_reachable_sets(graph, assemblies, invariant_nodes):
+    cut_graph = graph.copy()
+    cut_graph.remove_nodes_from(assemblies)
+    successor_sets = {}
+    predecessors = {}
+    for assembly in assemblies:
+        # A successor that is a disjunctive node itself only contributes itself
+        successor_sets[assembly] = [frozenset(nx.bfs_tree(cut_graph, successor))
+                                    if successor in cut_graph else frozenset({successor})
+                                    for successor in graph.successors(assembly)]
+        predecessors[assembly] = next(iter(graph.predecessors(assembly)), None)
+    descendants = {}
+    for successor_set in itertools.chain.from_iterable(successor_sets.values()):
+        for node in successor_set & invariant_nodes:
+            if node not in descendants:
+                descendants[node] = frozenset(nx.bfs_tree(graph, node))
+    return {"successors": successor_sets, "predecessors": predecessors,
+            "descendants": descendants}
 
 
 # Configure the graph according to the permutation and prune all non-required nodes
-def create_graph_permutation(graph, root_node, invariant_nodes, permutation, fetcher):
+def create_graph_permutation(graph, root_node, invariant_nodes, permutation, fetcher,
+                             reachable_sets=None):
+    if reachable_sets is None:
+        reachable_sets = create_reachable_sets(graph, permutation, invariant_nodes)
     # Determine the set of nodes that we want to keep as children of the disjunctive nodes
     nodes_to_keep = set()
     nodes_to_delete = set()
-    # Go from top to bottom so the shadowing check will be effective for assembly in
-    # reversed(permutation):
-    for assembly in permutation:
-        nodes_to_keep_per_assembly = set()
+    # Go from top to bottom so the shadowing check will be effective
+    for assembly, configuration in permutation.items():
+        nodes_to_keep_per_assembly = {assembly}  # Add the disjunctive node
         nodes_to_delete_per_assembly = set()
 
-        nodes_to_keep_per_assembly |= {assembly}  # Add the disjunctive node
-        # Add all its successors that are active in this configuration to nodes_to_keep
-        # add all inactive successors to nodes_to_delete
-        for index, successor in enumerate(graph.successors(assembly)):  # look at all successors
-            # Graph containing all nodes reachable from the successor
-            inv_successor_graph = get_subgraph(graph, nx.bfs_tree(graph, successor))
-            # Cut off the successor tree at locations where more disjunctive nodes follow
-            for assembly_2 in permutation:  # variable name assembly is already in use
-                if assembly_2 in inv_successor_graph:
-                    inv_successor_graph.remove_node(assembly_2)
-
-            if index in permutation[assembly]:  # check if the current successor is in permutation
-                # Add the node list of this successor tree to the set of nodes that shall be kept
-                nodes_to_keep_per_assembly |= set(nx.bfs_tree(inv_successor_graph, successor))
+        # Add the trees of all successors that are active in this configuration to nodes_to_keep,
+        # add the trees of all inactive successors to nodes_to_delete. The trees are cut off at
+        # locations where more disjunctive nodes follow
+        for index, successor_set in enumerate(reachable_sets["successors"][assembly]):
+            if index in configuration:  # check if the current successor is in permutation
+                nodes_to_keep_per_assembly |= successor_set
             else:
-                # Add the node list of this successor tree to the set of nodes to be deleted
-                nodes_to_delete_per_assembly |= set(nx.bfs_tree(inv_successor_graph, successor))
-
-            # In case of interdependencies, make sure that the nodes_to_delete will
-            # not cause the removal of nodes required for the selected branch(es)
-            nodes_to_delete_per_assembly -= nodes_to_keep_per_assembly
-            nodes_to_delete_per_assembly -= nodes_to_keep
-
-        # Check if the nodes_to_delete cuts into the set of invariant_nodes
-        while any([node in invariant_nodes for node in nodes_to_delete_per_assembly]):
-            for node in nodes_to_delete_per_assembly:
-                if node in invariant_nodes:
-                    nodes_to_delete_per_assembly -= set(nx.bfs_tree(graph, node))
-                    break
+                nodes_to_delete_per_assembly |= successor_set
+
+        # In case of interdependencies, make sure that the nodes_to_delete will
+        # not cause the removal of nodes required for the selected branch(es)
+        nodes_to_delete_per_assembly -= nodes_to_keep_per_assembly
+        nodes_to_delete_per_assembly -= nodes_to_keep
+
+        # Make sure that the nodes_to_delete do not cut into the set of invariant_nodes
+        for node in nodes_to_delete_per_assembly & invariant_nodes:
+            nodes_to_delete_per_assembly -= reachable_sets["descendants"][node]
 
         # Check if the assembly is shadowed by an earlier assembly
-        if list(graph.predecessors(assembly))[0] in nodes_to_delete:
+        if reachable_sets["predecessors"][assembly] in nodes_to_delete:
             # If the assembly is shadowed by a higher one, we will not update the nodes_to_keep and
             # nodes_to_delete sets
             logging.debug(f"[{get_node_name(graph, root_node)}] Assembly {assembly} is shadowed by "
@@ -361,42 +370,70 @@ def create_graph_permutation(graph, root_node, invariant_nodes, permutation, fet
 
     # The nodes remaining in the graph are the union of the invariant_nodes and node_to_keep
     new_node_list = nodes_to_keep | invariant_nodes
+    # Do not build the graph if an earlier permutation yielded the same one, i.e. where one
+    # assembly shadowed another
+    if fetcher.is_duplicate(new_node_list):
+        return
 
     # Get the graph that connects the components required in this configuration to root_node
     new_graph = get_subgraph(graph, new_node_list)
 
-    fetcher.add_permutation(root_node, new_graph, new_node_list)
+    fetcher.add_permutation(root_node, new_graph, new_node_list, permutation)
+
+
+# Maximum number of permutations sent to a worker process at once, and number of chunks per
+# worker that may be queued before the results of the oldest one are collected
+permutation_chunk_size = 64
+chunks_per_worker = 4
 
 
-# Distribute the analysis of all permutations over multiple threads
+# Run create_graph_permutation for a chunk of permutations in a worker process
+def create_graph_permutations(graph, root_node, invariant_nodes, permutations, reachable_sets):
+    fetcher = PermutationFetcher(len(permutations))
+    for permutation in permutations:
+        create_graph_permutation(graph, root_node, invariant_nodes, permutation, fetcher,
+                                 reachable_sets)
+    return *fetcher.get_graph_lists(), fetcher.duplicates
+
+
+# Distribute the analysis of all permutations over the worker processes of executor, or analyze
+# them in this process if executor is None. permutations may be a generator, it is consumed in
+# chunks and the unique graphs are returned in the order of the permutations
 def create_graphs_mode(graph, root_node, node_list, invariant_nodes, configuration_space,
-                       permutations, threading):
-    number_of_permutations = len(permutations)
+                       permutations, number_of_permutations, executor=None, workers=1):
     fetcher = PermutationFetcher(number_of_permutations)
     logging.debug(f"[{get_node_name(graph, root_node)}] Created permutation fetcher object for "
                   f"{number_of_permutations} permutations")
-    if threading:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=32) as executor:
-            for permutation in permutations:
-                # launch a thread that shall check the permutation
-                executor.submit(create_graph_permutation, graph, root_node, invariant_nodes,
-                                permutation, fetcher)
-        timeout = 30  # seconds
-        while not fetcher.get_done() and timeout > 0:
-            logging.info(f"[{get_node_name(graph, root_node)}] Waiting for all permutation "
-                         f"threads to finish")
-            time.sleep(2)
-            timeout -= 2
+    # The assemblies are the same in every permutation of the mode
+    reachable_sets = create_reachable_sets(graph, configuration_space, invariant_nodes)
+    if executor:
+        # Only a bounded number of chunks is in flight, so the generator is never materialized.
+        # Collecting the oldest future first keeps the results in the order of the permutations
+        max_pending = chunks_per_worker * workers
+        # Smaller chunks for small modes, so that every worker gets some permutations
+        chunk_size = max(1, min(permutation_chunk_size, -(-number_of_permutations // workers)))
+        pending = collections.deque()
+        permutations = iter(permutations)
+        while chunk := list(itertools.islice(permutations, chunk_size)):
+            pending.append(executor.submit(create_graph_permutations, graph, root_node,
+                                           invariant_nodes, chunk, reachable_sets))
+            if len(pending) >= max_pending:
+                fetcher.extend(*pending.popleft().result())
+        while pending:
+            fetcher.extend(*pending.popleft().result())
     else:
         for permutation in permutations:
-            create_graph_permutation(graph, root_node, invariant_nodes, permutation, fetcher)
-    graph_list, node_lists = fetcher.get_graph_lists()
-    return graph_list, node_lists
+            create_graph_permutation(graph, root_node, invariant_nodes, permutation, fetcher,
+                                     reachable_sets)
+    if fetcher.duplicates:
+        logging.info(f"[{get_node_name(graph, root_node)}] Deleted {fetcher.duplicates} duplicate "
+                     f"graphs")
+    return fetcher.get_graph_lists()
 
 
 # Determine the subgraph and invariant nodes for every mode. Get all permutations and call
 # create_graphs_mode for analyzing every configuration
-def create_graph_list_mode(main_graph, root_node, list_fetcher, threading):
+def create_graph_list_mode(main_graph, root_node, list_fetcher, executor=None, workers=1):
     logging.info(f"[{get_node_name(main_graph, root_node)}] Start analysis")
 
     # Get the subgraph for this root node containing all nodes that are reachable from root_node
@@ -404,16 +441,17 @@ def create_graph_list_mode(main_graph, root_node, list_fetcher, threading):
     if len(node_list) <= 1:
         logging.warning(f"[{get_node_name(main_graph, root_node)}] Node list empty for root node "
                         f"{root_node} ({get_node_name(main_graph, root_node)}). Skipping...")
-        list_fetcher.skip(root_node)
+        list_fetcher.skip()
+        return
     subgraph = get_subgraph(main_graph, node_list)
     layers = get_layers(subgraph)
 
     # Analyze the disjunctive assemblies and get all possible configurations for each of them
     configurations, configuration_space_mode, number_of_permutations \
         = create_configuration_space(subgraph, layers)
-    # Compile all combinations of configurations for all assemblies. Each permutation will yield
+    # Enumerate all combinations of configurations for all assemblies. Each permutation will yield
     # one feasible configuration of the whole graph
-    permutations = create_permutations(configurations)
+    permutations = iterate_permutations(configurations)
 
     # Determine the set of nodes not affected by the configurations
     inv_subgraph = subgraph.copy()
@@ -426,11 +464,11 @@ def create_graph_list_mode(main_graph, root_node, list_fetcher, threading):
     logging.debug(f"[{get_node_name(subgraph, root_node)}] {invariant_nodes=}")
 
     # create_graphs_mode will look at each configuration determined by the permutations
-    graph_list, node_lists = create_graphs_mode(subgraph, root_node, node_list, invariant_nodes,
-                                                configuration_space_mode, permutations, threading)
-    # Remove duplicate configurations, i.e. where one assembly shadowed another
-    unique_graph_list_mode, unique_node_lists_mode, configuration_list_mode \
-        = remove_duplicates(graph_list, node_lists, permutations, root_node)
+    # Duplicate configurations, i.e. where one assembly shadowed another, are skipped already
+    unique_graph_list_mode, unique_node_lists_mode, configuration_list_mode = \
+        create_graphs_mode(subgraph, root_node, node_list, invariant_nodes,
+                           configuration_space_mode, permutations, number_of_permutations,
+                           executor, workers)
     # Generate the component_lists which is useful for checking fault isolability and tolerance
     component_lists_mode = [sorted([get_node_name(graph, node)
                                     for node in find_leaf_nodes(graph, type='components')])
@@ -439,97 +477,141 @@ def create_graph_list_mode(main_graph, root_node, list_fetcher, threading):
                           component_lists_mode, configuration_list_mode, configuration_space_mode)
 
 
-# Distribute the analysis of the individual modes over multiple threads
-def create_graph_list(main_graph, threading=False):
+# Number of CPUs this process may run on, which can be less than os.cpu_count()
+def get_available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Analyze the individual modes. With threading, the permutations of every mode are analyzed by
+# a pool of worker processes, because the networkx calls hold the GIL and gain nothing from threads.
+# workers defaults to the number of available CPUs
+def create_graph_list(main_graph, threading=False, workers=None):
     root_nodes = find_root_nodes(main_graph)  # modes equal root nodes
-    # list_fetcher will collect the results of the individual threads
+    # list_fetcher will collect the results of the individual modes
     list_fetcher = GraphListFetcher(len(root_nodes))
-    # Threading allows for faster execution if multiple modes exist in the graph
     if threading:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        workers = workers or get_available_cpus()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
             for root_node in root_nodes:
-                # launch a thread that checks the mode
-                executor.submit(create_graph_list_mode, main_graph, root_node, 
-                                list_fetcher, threading)
-        timeout = 30  # seconds
-        while not list_fetcher.get_done() and timeout > 0:
-            logging.info("Waiting for all mode threads to finish")
-            time.sleep(2)
-            timeout -= 2
+                create_graph_list_mode(main_graph, root_node, list_fetcher, executor, workers)
     else:
         for root_node in root_nodes:
-            create_graph_list_mode(main_graph, root_node, list_fetcher, threading)
+            create_graph_list_mode(main_graph, root_node, list_fetcher)
 
-    # Retrieve the results of the individual threads from list_fetcher
+    # Retrieve the results of the individual modes from list_fetcher
     unique_graph_list, unique_node_lists, component_lists, configuration_list, configuration_space \
         = list_fetcher.get_graph_lists()
     return unique_graph_list, unique_node_lists, component_lists, configuration_list, \
         configuration_space
 
 
-# Determine if the graph is isolable for n faults
-def check_isolability(all_equipment, component_lists, number_of_faults):
-    # Determine grammatical number for accurate output messages
-    plural = False if number_of_faults == 1 else True
+# Number of fault combinations that check_isolability compares with the configurations at once,
+# and limit on the size of the (combinations x configurations x words) intermediate arrays
+isolability_batch_size = 256
+isolability_max_chunk_elements = 1 << 22
+
 
+# Encode lists of names as bitmasks over bit_indices, split into 64 bit words
+def get_name_masks(name_lists, bit_indices, number_of_words):
+    masks = []
+    for names in name_lists:
+        mask = 0
+        for name in names:
+            mask |= 1 << bit_indices[name]
+        masks.append([(mask >> (64 * word)) & 0xFFFFFFFFFFFFFFFF
+                      for word in range(number_of_words)])
+    return np.array(masks, dtype=np.uint64).reshape(len(masks), number_of_words)
+
+
+# Determine if the graph is isolable for n faults. The checks for n-1, n-2, ... 1 faults are
+# appended, as all orders share the same configuration bitmasks
+def check_isolability(all_equipment, component_lists, number_of_faults):
+    # Every component is a bit of the bitmasks. Components that only appear in configurations get
+    # bits after those of all_equipment, so they never belong to the expected alternative sets
+    bit_indices = {}
+    for name in all_equipment:
+        bit_indices.setdefault(name, len(bit_indices))
+    number_of_equipment_bits = len(bit_indices)
     # Flatten the component_lists dictionary into one long list so we do not need to iterate
     # through modes to get all configurations of our system
-    all_component_lists = []
-    for root_node in component_lists:
-        for configuration in component_lists[root_node]:
-            all_component_lists.append(configuration)
-
-    # Combinations for which we can find an alternative set. Every component that is independently
-    # accessible for the given combination of component faults is included in the alternative set
-    isolable_combinations = []
-    non_isolable_combinations = []  # complement to isolable_combinations
-    # The set of components missing in the alternative set for each item in
-    # non_isolabe_combinations
+    all_component_lists = [configuration for root_node in component_lists
+                           for configuration in component_lists[root_node]]
+    for component_list in all_component_lists:
+        for name in component_list:
+            bit_indices.setdefault(name, len(bit_indices))
+    names = list(bit_indices)
+    number_of_words = max(1, (len(bit_indices) + 63) // 64)
+    # Duplicate configurations do not change the alternative sets
+    configurations = np.unique(get_name_masks(all_component_lists, bit_indices, number_of_words),
+                               axis=0)
+    equipment_mask = get_name_masks([names[:number_of_equipment_bits]], bit_indices,
+                                    number_of_words)
+    equipment_bits = np.array([bit_indices[name] for name in all_equipment], dtype=np.int64)
+    configuration_chunk_size = max(1, isolability_max_chunk_elements
+                                   // (isolability_batch_size * number_of_words))
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+    isolable = []
+    non_isolable = []
+    # The set of components missing in the alternative set for each item in non_isolable
     missing_components = {}
-    # Iterate through all components that we want to isolate. For multiple faults, iterate through
-    # all combinations of n components.
-    # set(itertools.combinations(all_equipment, number_of_faults))
-    #   - set(isolable_combinations) == set(non_isolable_combinations)
-    for components in itertools.combinations(all_equipment, number_of_faults):
-        # Add components to the alternative_set if they are independently accessible, i.e. they are
-        # part of a configuration that does not contain the component to be isolated
-        alternative_set = set()
-        for component_list in all_component_lists:  # iterate through all configurations
-            if not set(components).intersection(set(component_list)):  # check independent access
-                for element in component_list:  # add to the alternative_set
-                    alternative_set.add(element)  # set will automatically prune duplicates
-
-        # Check if all components except for those we wanted to isolate have been added
-        if alternative_set == set(all_equipment) - set(components):
-            isolable_combinations.append(components)  # This combination of components is isolable
-            logging.debug(f"Fault{'s' if plural else ''} in component{'s' if plural else ''} "
-                          f"{', '.join(components)} {'are' if plural else 'is'} isolable.")
-        else:
-            non_isolable_combinations.append(components)  # This combination is not isolable
-            logging.debug(f"Fault{'s' if plural else ''} in component{'s' if plural else ''} "
-                          f"{', '.join(components)} {'are' if plural else 'is'} not isolable.")
+    # If the user checks for 3-fault isolability, we also check for 2-fault and 1-fault
+    # isolability
+    for faults in [number_of_faults] + list(range(number_of_faults - 1, 0, -1)):
+        # Determine grammatical number for accurate output messages
+        plural = False if faults == 1 else True
+        isolable_combinations = []
+        non_isolable_combinations = []
+        combinations = itertools.combinations(range(len(all_equipment)), faults)
+        while batch := list(itertools.islice(combinations, isolability_batch_size)):
+            # Bitmasks of the components to isolate
+            fault_bits = equipment_bits[np.array(batch, dtype=np.int64).reshape(len(batch), faults)]
+            fault_masks = np.zeros((len(batch), number_of_words), dtype=np.uint64)
+            rows = np.arange(len(batch))
+            for column in range(faults):
+                fault_masks[rows, fault_bits[:, column] // 64] |= \
+                    np.uint64(1) << (fault_bits[:, column] % 64).astype(np.uint64)
+            # Every component that is part of a configuration which does not contain any of the
+            # components to isolate is independently accessible and belongs to the alternative set
+            alternative_sets = np.zeros_like(fault_masks)
+            for start in range(0, len(configurations), configuration_chunk_size):
+                chunk = configurations[None, start:start + configuration_chunk_size, :]
+                independent = ~(fault_masks[:, None, :] & chunk).any(axis=2)
+                alternative_sets |= np.bitwise_or.reduce(
+                    np.where(independent[:, :, None], chunk, np.uint64(0)), axis=1)
+            # Check if all components except for those we wanted to isolate have been added
+            expected_sets = equipment_mask & ~fault_masks
+            isolable_rows = (alternative_sets == expected_sets).all(axis=1)
             # Analyze which components were not accessible without also using the component to
             # isolate. This gives the user a hint on which components need more flexibility around
             # them in the graph
-            missing_components_combination = set(all_equipment) - set(components) - alternative_set
-            logging.debug(f"The alternative set is missing the components "
-                          f"{missing_components_combination} to make "
-                          f"{components} isolable.")
-            missing_components[components] = sorted(missing_components_combination)
-
-    # Put the results in alphabetical order
-    isolable = sorted(isolable_combinations)
-    non_isolable = sorted(non_isolable_combinations)
-
-    # Add the data of the isolability check for fewer number of faults. If the user checks for
-    # 3-fault isolability, we will append the checks for 2-fault and for 1-fault isolability
-    if number_of_faults > 1:
-        # recursive call to the same function
-        add_isolable, add_non_isolable, add_missing_components = \
-            check_isolability(all_equipment, component_lists, number_of_faults - 1)
-        isolable += add_isolable
-        non_isolable += add_non_isolable
-        missing_components = {**missing_components, **add_missing_components}
+            missing_sets = expected_sets & ~alternative_sets
+            for row, indices in enumerate(batch):
+                components = tuple(all_equipment[index] for index in indices)
+                if isolable_rows[row]:
+                    isolable_combinations.append(components)
+                    if debug:
+                        logging.debug(f"Fault{'s' if plural else ''} in component"
+                                      f"{'s' if plural else ''} {', '.join(components)} "
+                                      f"{'are' if plural else 'is'} isolable.")
+                    continue
+                non_isolable_combinations.append(components)
+                missing_mask = sum(int(word) << (64 * word_index)
+                                   for word_index, word in enumerate(missing_sets[row]))
+                missing_components[components] = sorted(names[bit] for bit in range(len(names))
+                                                        if missing_mask >> bit & 1)
+                if debug:
+                    logging.debug(f"Fault{'s' if plural else ''} in component"
+                                  f"{'s' if plural else ''} {', '.join(components)} "
+                                  f"{'are' if plural else 'is'} not isolable.")
+                    logging.debug(f"The alternative set is missing the components "
+                                  f"{set(missing_components[components])} to make "
+                                  f"{components} isolable.")
+        # Put the results in alphabetical order
+        isolable += sorted(isolable_combinations)
+        non_isolable += sorted(non_isolable_combinations)
 
     return isolable, non_isolable, missing_components
 
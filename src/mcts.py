@@ -13,10 +13,14 @@
 # limitations under the License.
 
 # Python built-in libraries
+import concurrent.futures
+import gzip
 import logging
 import logging.handlers
+import math
 import os
 import pathlib
+import pickle
 import random
 import re
 import sys
@@ -25,15 +29,20 @@ import argparse
 
 # third-party libraries
 import networkx as nx
+import numpy as np
 from tqdm import tqdm
 
 # project-specific libraries
 import evaluate_prism_strat
 from base import get_configuration_all_modes, no_possible_successors, get_fault_probabilities, \
     remove_unnecessary_nodes, list_to_int
-from evaluate_mcts_strategy import evaluate_mcts_strategy
-from expand import add_edge, mcts_expand, add_state
-from export import export_strategy_graph, export_mcts_strategy, export_prism_file
+from binary_strategy import write_binary_strategy
+from evaluate_mcts_strategy import evaluate_mcts_strategy, evaluate_binary_strategy
+from expand import add_edge, mcts_expand, add_state, find_useful_actions_frontier, \
+    reopen_widened_states
+from frontier import Frontier
+from export import export_strategy_graph, export_mcts_strategy, export_prism_file, \
+    export_prism_explicit_files
 from selec import mcts_select
 from simulations import mcts_simulate
 from naive import evaluate_naive
@@ -61,38 +70,38 @@ def setup_logging():
     logger.addHandler(ch)
 
 
-def is_not_finished(nodes_to_explore):
-    if len(nodes_to_explore) == 0:
+def is_not_finished(frontier):
+    if frontier.size == 0:
         return False
     else:
         return True
 
 
 def mcts(mcts_graph, mcts_data, statistics, parameters, state):
-    total_sim_iter = 0
+    total_sim_iter = statistics["round_simulations"]
     iteration_number = 0
-    while is_not_finished(statistics["nodes_to_explore"]):
+    while is_not_finished(statistics["frontier"]):
         iteration_number += 1
+        save_checkpoint_if_due(mcts_graph, mcts_data, statistics, parameters)
 
         if parameters["successors_to_keep"] == 0:
-            i = random.randrange(len(statistics["nodes_to_explore"]))
-            selected_state = statistics["nodes_to_explore"][i]
+            selected_state = statistics["frontier"].pick_random()
             if parameters["debug"]:
                 logging.debug("Expanding node: " + str(selected_state))
             if no_possible_successors(statistics, selected_state):
-                statistics["nodes_to_explore"].remove(selected_state)
+                statistics["frontier"].remove(selected_state)
                 continue
             mcts_expand(mcts_graph, mcts_data, statistics, parameters, selected_state)
-            statistics["nodes_explored"].append(selected_state)
-            statistics["nodes_to_explore"].remove(selected_state)
+            statistics["frontier"].mark_explored(selected_state)
             mcts_graph = mcts_trim(mcts_graph, mcts_data, statistics, parameters, selected_state)
 
         else:
-            selected_state, path, action_path = mcts_select(mcts_graph, statistics, state)
+            selected_state, path, action_path = mcts_select(mcts_graph, mcts_data, statistics,
+                                                            parameters, state)
             if parameters["debug"]:
                 logging.debug("Expanding node: " + str(selected_state))
             if no_possible_successors(statistics, selected_state):
-                statistics["nodes_to_explore"].remove(selected_state)
+                statistics["frontier"].remove(selected_state)
                 continue
             num_new_successors = mcts_expand(mcts_graph, mcts_data, statistics, parameters,
                                              selected_state)
@@ -104,12 +113,14 @@ def mcts(mcts_graph, mcts_data, statistics, parameters, state):
             num_sim = mcts_simulate(mcts_data, statistics, parameters, selected_state,
                                     path, action_path, max_sim_round)
 
-            statistics["nodes_explored"].append(selected_state)
-            statistics["nodes_to_explore"].remove(selected_state)
+            statistics["frontier"].mark_explored(selected_state)
             statistics["total_simulations"] += num_sim
+            if parameters["selection_policy"] == "pw":
+                reopen_widened_states(mcts_data, statistics, parameters, path)
 
             mcts_graph = mcts_trim(mcts_graph, mcts_data, statistics, parameters, selected_state)
             total_sim_iter += num_sim
+            statistics["round_simulations"] = total_sim_iter
     return mcts_graph, total_sim_iter
 
 
@@ -126,23 +137,209 @@ def get_state_from_file(statistics, filename):
     return list_to_int(statistics, state)
 
 
-def mcts_outer(parameters):
-    # initialize the mcts graph
-    mcts_graph = nx.DiGraph()
+# Keys of statistics that change during the search and go into a checkpoint. The parsed inputs
+# are rebuilt from the input files and the caches refill on demand when resuming
+checkpoint_keys = ["total_simulations", "rounds", "frontier", "available_actions", "parents",
+                   "widening", "initial_state_index", "round_simulations", "round_in_progress",
+                   "rng"]
+
+# Seconds between checkpoints if checkpointing is asked for without giving an interval
+default_checkpoint_interval = 600
+
+# Parameters that have to match for a checkpoint to be resumed
+checkpoint_parameters = ["input_file", "successors_to_keep", "cost_margin",
+                         "simulations_for_each_children", "sampling_type", "selection_policy",
+                         "uct_constant", "pw_constant", "pw_exponent", "batched_rollouts",
+                         "min_batched_rollouts"]
+
+
+# Write the search state and the state of the random number generators to a compressed pickle.
+# The checkpoint replaces the previous one atomically, so being killed while writing is harmless
+def save_checkpoint(mcts_graph, mcts_data, statistics, parameters):
+    checkpoint = {"mcts_graph": mcts_graph,
+                  "mcts_data": mcts_data,
+                  "statistics": {key: statistics.get(key) for key in checkpoint_keys},
+                  "initial_states": statistics["search_initial_states"],
+                  "parameters": {key: parameters.get(key) for key in checkpoint_parameters},
+                  "random_state": random.getstate()}
+    temporary_file = statistics["checkpoint_file"] + ".tmp"
+    with gzip.open(temporary_file, "wb", compresslevel=1) as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_file, statistics["checkpoint_file"])
+    statistics["last_checkpoint_time"] = time.time()
+
+
+def save_checkpoint_if_due(mcts_graph, mcts_data, statistics, parameters):
+    if statistics["checkpoint_file"] != "" and parameters["checkpoint_interval"] > 0 and \
+            time.time() - statistics["last_checkpoint_time"] >= parameters["checkpoint_interval"]:
+        save_checkpoint(mcts_graph, mcts_data, statistics, parameters)
+
+
+# Restore the search state of a checkpoint into mcts_data and statistics and return its graph, or
+# None if the checkpoint belongs to a search with other initial states or parameters
+def load_checkpoint(mcts_data, statistics, parameters, initial_states):
+    with gzip.open(statistics["checkpoint_file"], "rb") as f:
+        checkpoint = pickle.load(f)
+    if checkpoint["initial_states"] != list(initial_states) or checkpoint["parameters"] != \
+            {key: parameters.get(key) for key in checkpoint_parameters}:
+        print("Checkpoint", statistics["checkpoint_file"], "does not match this search, "
+              "starting from scratch")
+        return None
+    mcts_data.clear()
+    mcts_data.update(checkpoint["mcts_data"])
+    statistics.update(checkpoint["statistics"])
+    random.setstate(checkpoint["random_state"])
+    print("Resuming from checkpoint", statistics["checkpoint_file"], "after",
+          statistics["initial_state_index"], "of", len(initial_states), "initial states")
+    return checkpoint["mcts_graph"]
+
+
+# Run one search after another from the given initial states on a shared graph. The progress is
+# checkpointed regularly and a search can be resumed from its checkpoint
+def mcts_search(mcts_graph, mcts_data, statistics, parameters, initial_states):
     root_node = 0
-    mcts_graph.add_node(root_node)
-    mcts_data = {}
+    bar = "----------------------------------------------------------------------------------" \
+          "---------"  # 91 columns wide
+    statistics.update({"initial_state_index": 0,
+                       "round_simulations": 0,
+                       "round_in_progress": False,
+                       "search_initial_states": list(initial_states),
+                       "last_checkpoint_time": time.time()})
+    if parameters["resume"] and os.path.isfile(statistics["checkpoint_file"]):
+        checkpoint_graph = load_checkpoint(mcts_data, statistics, parameters, initial_states)
+        if checkpoint_graph is not None:
+            mcts_graph = checkpoint_graph
+    elif parameters["resume"]:
+        print(f'No checkpoint found at {statistics["checkpoint_file"]}, starting from scratch')
+    find_useful_actions_frontier(statistics, initial_states)
+    for index in range(statistics["initial_state_index"], len(initial_states)):
+        state = initial_states[index]
+        if not statistics["round_in_progress"]:
+            if parameters["debug"]:
+                logging.debug(bar)
+                logging.debug(bar)
+                logging.debug("Initial state: " + str(state) + "\n")
+            add_state(mcts_graph, mcts_data, statistics, state)
+            add_edge(mcts_graph, root_node, state)
+            statistics["frontier"].reopen(state)
+            statistics["round_simulations"] = 0
+            statistics["round_in_progress"] = True
+        mcts_graph, num_current_round_sim = mcts(mcts_graph, mcts_data, statistics, parameters,
+                                                 state)
+        statistics["total_simulations"] += num_current_round_sim
+        statistics["rounds"] += 1
+        statistics["initial_state_index"] = index + 1
+        statistics["round_in_progress"] = False
+        if parameters["debug"]:
+            logging.debug("Total simulations: " + str(statistics["total_simulations"]))
+            logging.debug("finished mcts from state: " + str(state))
+            logging.debug(bar, "\n\n")
+    if statistics["checkpoint_file"] != "" and parameters["checkpoint_interval"] > 0:
+        save_checkpoint(mcts_graph, mcts_data, statistics, parameters)
+    return mcts_graph
 
+
+# Search the initial states of one shard in a worker process with its own graph and RNG
+def mcts_worker(statistics, parameters, initial_states, seed, shard_index):
+    random.seed(seed)
+    mcts_graph = nx.DiGraph()
+    mcts_graph.add_node(0)
+    mcts_data = {}
+    worker_statistics = {**statistics,
+                         'total_simulations': 0,
+                         'rounds': 0,
+                         'frontier': Frontier(),
+                         "available_actions": {},
+                         "parents": {},
+                         "widening": {},
+                         "action_outcomes": {},
+                         "q_values": {},
+                         "q_dependents": {},
+                         "int_to_list_mapping": {},
+                         "rng": None,
+                         "checkpoint_file": worker_checkpoint_file(parameters, shard_index)}
+    mcts_graph = mcts_search(mcts_graph, mcts_data, worker_statistics, parameters, initial_states)
+    return mcts_graph, mcts_data, {key: worker_statistics[key]
+                                   for key in ["total_simulations", "rounds", "frontier",
+                                               "available_actions"]}
+
+
+# Every worker checkpoints its own shard next to the checkpoint file of the whole search
+def worker_checkpoint_file(parameters, shard_index):
+    if parameters["checkpoint_file"] == "":
+        return ""
+    return f'{parameters["checkpoint_file"]}.worker{shard_index}'
+
+
+# Split the initial states into contiguous shards, search them in a process pool and merge the
+# results in shard order so that the outcome does not depend on the scheduling of the workers
+def mcts_parallel(statistics, parameters):
+    initial_states = statistics["initial_states"]
+    number_of_shards = min(parameters["workers"], len(initial_states))
+    shard_size = -(-len(initial_states) // number_of_shards)  # ceiling division
+    shards = [initial_states[i:i + shard_size] for i in range(0, len(initial_states), shard_size)]
+    seeds = [random.getrandbits(64) for _ in shards]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=number_of_shards) as executor:
+        results = list(executor.map(mcts_worker,
+                                    [statistics] * len(shards),
+                                    [parameters] * len(shards),
+                                    shards,
+                                    seeds,
+                                    range(len(shards))))
+    return merge_search_results(statistics, results)
+
+
+def merge_search_results(statistics, results):
+    mcts_graph = nx.DiGraph()
+    mcts_graph.add_node(0)
+    mcts_data = {}
+    explored = set()
+    for worker_graph, worker_data, worker_statistics in results:
+        mcts_graph.add_nodes_from(worker_graph.nodes)
+        mcts_graph.add_edges_from(worker_graph.edges)
+        # Pool the rollout costs and visits of states that were reached in several workers
+        for state, (cost, visits) in worker_data.items():
+            if state in mcts_data:
+                mcts_data[state][0] += cost
+                mcts_data[state][1] += visits
+            else:
+                mcts_data[state] = [cost, visits]
+        # Explored states keep the union of the actions that survived trimming in any worker
+        worker_frontier = worker_statistics["frontier"]
+        for state, indices in worker_statistics["available_actions"].items():
+            if worker_frontier.is_explored(state):
+                if state in explored:
+                    statistics["available_actions"][state] = \
+                        np.union1d(statistics["available_actions"][state], indices) \
+                        .astype(indices.dtype)
+                else:
+                    statistics["available_actions"][state] = indices
+                    explored.add(state)
+            elif state not in statistics["available_actions"]:
+                statistics["available_actions"][state] = indices
+        statistics["frontier"].merge(worker_frontier)
+        statistics["total_simulations"] += worker_statistics["total_simulations"]
+        statistics["rounds"] += worker_statistics["rounds"]
+    return mcts_graph, mcts_data
+
+
+# Parse the model and the input files into a fresh statistics dict
+def init_statistics(parameters):
     # initialize some statistics to keep track of
     statistics = {'total_simulations': 0,
                   'rounds': 0,
-                  'nodes_to_explore': [],
-                  'nodes_explored': [],
+                  'frontier': Frontier(),
                   "available_actions": {},
+                  "parents": {},
+                  "widening": {},
+                  "action_outcomes": {},
+                  "q_values": {},
+                  "q_dependents": {},
                   "name_to_action_mapping": {},
                   "action_to_name_mapping": {},
                   "int_to_list_mapping": {},
-                  "initial_states": []
+                  "initial_states": [],
+                  "checkpoint_file": parameters["checkpoint_file"]
     }
 
     # noinspection PyBroadException
@@ -160,11 +357,20 @@ def mcts_outer(parameters):
         print("Syntax error in input file:",
               parameters["equipment_fail_probabilities_file"],
               "in the equipment_fault_probabilities part")
+    return statistics
+
+
+def mcts_outer(parameters):
+    # initialize the mcts graph
+    mcts_graph = nx.DiGraph()
+    root_node = 0
+    mcts_graph.add_node(root_node)
+    mcts_data = {}
+
+    statistics = init_statistics(parameters)
 
     print("Starting MCTS...")
     time.sleep(0.01)
-    bar = "----------------------------------------------------------------------------------" \
-          "---------"  # 91 columns wide
 
     if parameters["initial_state_file"] != "":
         statistics["initial_states"].append(get_state_from_file(statistics, parameters["initial_state_file"]))
@@ -189,22 +395,11 @@ def mcts_outer(parameters):
     #         logging.debug("finished mcts from state: " + str(state))
     #         logging.debug(bar, "\n\n")
     # else:
-    for state in statistics["initial_states"]:
-        if parameters["debug"]:
-            logging.debug(bar)
-            logging.debug(bar)
-            logging.debug("Initial state: " + str(state) + "\n")
-        add_state(mcts_graph, mcts_data, statistics, state)
-        add_edge(mcts_graph, root_node, state)
-        statistics["nodes_to_explore"].append(state)
-        mcts_graph, num_current_round_sim = mcts(mcts_graph, mcts_data, statistics, parameters,
-                                                 state)
-        statistics["total_simulations"] += num_current_round_sim
-        statistics["rounds"] += 1
-        if parameters["debug"]:
-            logging.debug("Total simulations: " + str(statistics["total_simulations"]))
-            logging.debug("finished mcts from state: " + str(state))
-            logging.debug(bar, "\n\n")
+    if parameters["workers"] > 1 and len(statistics["initial_states"]) > 1:
+        mcts_graph, mcts_data = mcts_parallel(statistics, parameters)
+    else:
+        mcts_graph = mcts_search(mcts_graph, mcts_data, statistics, parameters,
+                                 statistics["initial_states"])
 
     if parameters["debug"]:
         logging.debug("MCTS data: " + str(mcts_data) + "\n\n")
@@ -236,6 +431,11 @@ def arguments(parameters):
                            action='store',
                            type=int,
                            help='Specify how many successors to keep after trimming')
+    my_parser.add_argument('--costmargin',
+                           action='store',
+                           type=float,
+                           help='Keep every action whose expected cost is within this margin of '
+                                'the best action instead of a fixed number of successors')
     my_parser.add_argument('--simulationsize',
                            action='store',
                            type=int,
@@ -246,10 +446,63 @@ def arguments(parameters):
                            help='Sampling type for simulations (0 or 1): 0 for sampling the next '
                                 'successor based on current probability and 1 for sampling a '
                                 'defect and then isolating the fault')
+    my_parser.add_argument('--selectionpolicy',
+                           action='store',
+                           choices=['random', 'uct', 'pw'],
+                           help='Policy for selecting the next node to expand: random (default), '
+                                'uct for UCB1 on the simulated costs, or pw for UCB1 with '
+                                'progressive widening: a state with n visits may use its '
+                                'ceil(4 * (n + 1) ^ 0.1) actions with the lowest cost per bit of '
+                                'information, more actions are admitted as its visits grow')
+    my_parser.add_argument('--uctconstant',
+                           action='store',
+                           type=float,
+                           help='exploration constant of the UCB1 selection')
+    my_parser.add_argument('--pwconstant',
+                           action='store',
+                           type=float,
+                           help='constant C of the progressive widening, a state with n visits '
+                                'may use ceil(C * (n + 1) ^ alpha) actions (default 4)')
+    my_parser.add_argument('--pwexponent',
+                           action='store',
+                           type=float,
+                           help='exponent alpha of the progressive widening (default 0.1)')
+    my_parser.add_argument('--batchedrollouts',
+                           action='store_true',
+                           help='run the simulations of each expansion in lockstep with NumPy. '
+                                'Expansions with fewer simulations than --minbatchedrollouts '
+                                'still run them one by one')
+    my_parser.add_argument('--minbatchedrollouts',
+                           action='store',
+                           type=int,
+                           help='smallest number of simulations of an expansion that is run '
+                                'batched with --batchedrollouts (default 512, 0 batches all)')
     my_parser.add_argument('--outputdir',
                            action='store',
                            type=str,
                            help='directory to store output')
+    my_parser.add_argument('--workers',
+                           action='store',
+                           type=int,
+                           help='number of processes that search the initial states and evaluate '
+                                'the strategies in parallel')
+    my_parser.add_argument('--seed',
+                           action='store',
+                           type=int,
+                           help='seed of the random number generators for a reproducible run')
+    my_parser.add_argument('--checkpointinterval',
+                           action='store',
+                           type=float,
+                           help='seconds between checkpoints of the search, 0 disables them. '
+                                'The search is only checkpointed if this, --checkpointfile or '
+                                '--resume is given, every 600 seconds by default')
+    my_parser.add_argument('--checkpointfile',
+                           action='store',
+                           help='name of checkpoint file (default: outputdir/'
+                                'mcts_checkpoint.pkl.gz)')
+    my_parser.add_argument('--resume',
+                           action='store_true',
+                           help='resume the search from the checkpoint file')
     my_parser.add_argument('-d',
                            '--debug',
                            action='store_true',
@@ -260,12 +513,34 @@ def arguments(parameters):
     my_parser.add_argument('--evaluatenaive',
                            action='store_true',
                            help='evaluate naive strategy')
+    my_parser.add_argument('--exactevaluation',
+                           action='store_true',
+                           help='compute the expected cost of the mcts or prism strategy exactly '
+                                'instead of sampling faults')
+    my_parser.add_argument('--ciwidth',
+                           action='store',
+                           type=float,
+                           help='sample faults until the confidence interval of the average cost '
+                                'of every initial mode is at most this wide')
+    my_parser.add_argument('--ciminsamples',
+                           action='store',
+                           type=int,
+                           help='number of samples an initial mode needs before its confidence '
+                                'interval counts as narrow enough (default 30)')
     my_parser.add_argument('--initialstatefile',
                            action='store',
                            help='give initial state as input')
     my_parser.add_argument('--strategyfile',
                            action='store',
                            help='name of strategy file')
+    my_parser.add_argument('--explicitprism',
+                           action='store_true',
+                           help='export the model for PRISM as explicit .tra, .sta, .lab and .trew '
+                                'files that PRISM imports directly')
+    my_parser.add_argument('--evaluatestrategy',
+                           action='store',
+                           help='evaluate the strategy in this binary strategy file instead of '
+                                'searching for one, and the naive strategy with --evaluatenaive')
     my_parser.add_argument('--reportfile',
                            action='store',
                            help='name of strategy report')
@@ -284,12 +559,51 @@ def arguments(parameters):
     if args.successorstokeep is not None:
         parameters["successors_to_keep"] = args.successorstokeep
 
+    if args.costmargin is not None:
+        parameters["cost_margin"] = args.costmargin
+
     if args.simulationsize is not None:
         parameters["simulations_for_each_children"] = args.simulationsize
 
     if args.samplingtype is not None:
         parameters["sampling_type"] = args.samplingtype
 
+    if args.selectionpolicy is not None:
+        parameters["selection_policy"] = args.selectionpolicy
+
+    if args.uctconstant is not None:
+        parameters["uct_constant"] = args.uctconstant
+
+    if args.pwconstant is not None:
+        parameters["pw_constant"] = args.pwconstant
+
+    if args.pwexponent is not None:
+        parameters["pw_exponent"] = args.pwexponent
+
+    if args.batchedrollouts is not None:
+        parameters["batched_rollouts"] = args.batchedrollouts
+
+    if args.minbatchedrollouts is not None:
+        parameters["min_batched_rollouts"] = args.minbatchedrollouts
+
+    if parameters["batched_rollouts"] and parameters["min_batched_rollouts"] > 1:
+        print("Batched rollouts for expansions with at least", parameters["min_batched_rollouts"],
+              "simulations, smaller expansions run their simulations one by one")
+
+    if args.workers is not None:
+        parameters["workers"] = args.workers
+
+    if args.seed is not None:
+        parameters["seed"] = args.seed
+
+    if args.checkpointinterval is not None:
+        parameters["checkpoint_interval"] = args.checkpointinterval
+    elif args.checkpointfile is not None or args.resume:
+        parameters["checkpoint_interval"] = default_checkpoint_interval
+
+    if args.resume is not None:
+        parameters["resume"] = args.resume
+
     if args.outputdir is not None:
         if not os.path.isdir(args.outputdir):
             os.mkdir(args.outputdir)
@@ -304,6 +618,12 @@ def arguments(parameters):
             parameters["successors_to_keep"] = 1
     if args.evaluatenaive is not None:
         parameters["evaluate_naive"] = args.evaluatenaive
+    if args.exactevaluation is not None:
+        parameters["exact_evaluation"] = args.exactevaluation
+    if args.ciwidth is not None:
+        parameters["confidence_interval_width"] = args.ciwidth
+    if args.ciminsamples is not None:
+        parameters["confidence_interval_min_samples"] = args.ciminsamples
     if args.initialstatefile is not None:
         parameters["initial_state_file"] = args.initialstatefile
     else:
@@ -314,11 +634,53 @@ def arguments(parameters):
     elif args.outputdir is not None:
         parameters["strategy_file"] = args.outputdir + "/strategy.prism"
 
+    parameters["binary_strategy_file"] = os.path.splitext(parameters["strategy_file"])[0] + ".bin"
+
+    if args.explicitprism is not None:
+        parameters["prism_explicit"] = args.explicitprism
+
+    if args.evaluatestrategy is not None:
+        parameters["evaluate_strategy_file"] = args.evaluatestrategy
+        # Without a search these options would be silently ignored
+        search_options = [option for option, value in
+                          [("--successorstokeep", args.successorstokeep),
+                           ("--costmargin", args.costmargin),
+                           ("--simulationsize", args.simulationsize),
+                           ("--samplingtype", args.samplingtype),
+                           ("--selectionpolicy", args.selectionpolicy),
+                           ("--uctconstant", args.uctconstant),
+                           ("--pwconstant", args.pwconstant),
+                           ("--pwexponent", args.pwexponent),
+                           ("--batchedrollouts", args.batchedrollouts),
+                           ("--minbatchedrollouts", args.minbatchedrollouts),
+                           ("--checkpointinterval", args.checkpointinterval),
+                           ("--checkpointfile", args.checkpointfile),
+                           ("--resume", args.resume),
+                           ("--mctsstrat", args.mctsstrat),
+                           ("--initialstatefile", args.initialstatefile),
+                           ("--strategyfile", args.strategyfile),
+                           ("--explicitprism", args.explicitprism),
+                           ("--dotfile", args.dotfile)]
+                          if value is not None and value is not False]
+        if search_options:
+            print('--evaluatestrategy does not search, it cannot be combined with',
+                  ", ".join(search_options))
+            sys.exit(1)
+
     if args.dotfile is not None:
         parameters["output_dot_file"] = args.dotfile
     elif args.outputdir is not None:
         parameters["output_dot_file"] = args.outputdir + "/graph.dot"
 
+    if args.checkpointfile is not None:
+        parameters["checkpoint_file"] = args.checkpointfile
+    elif args.outputdir is not None:
+        parameters["checkpoint_file"] = args.outputdir + "/mcts_checkpoint.pkl.gz"
+
+    if parameters["resume"] and parameters["checkpoint_file"] == "":
+        print('--resume needs a checkpoint file, give --checkpointfile or --outputdir')
+        sys.exit(1)
+
     if args.reportfile is not None:
         parameters["report_file"] = args.reportfile
     else:
@@ -334,6 +696,7 @@ def arguments(parameters):
              + f'simulationsize-{parameters["simulations_for_each_children"]}'
     model_name = f'{os.path.split(parameters["input_file"])[-1].split(".")[0]}_{suffix}'
     parameters["prism_model"] = os.path.join(args.outputdir, f'{model_name}.prism')
+    parameters["prism_explicit_model"] = os.path.join(args.outputdir, model_name)
     parameters["props_file"] = os.path.join(args.outputdir, f'{model_name}.props')
     parameters["prism_output"] = os.path.join(args.outputdir, f'{model_name}_prism_output.txt')
 
@@ -374,12 +737,31 @@ def main():
     # 1: sample a defect and find successor according to that defect
     path_of_src = str(pathlib.Path(__file__).parent.parent.resolve())
     parameters = {"successors_to_keep": 10,
+                  "cost_margin": None,
                   "simulations_for_each_children": 200,
                   "sampling_type": 0,
+                  "selection_policy": "random",
+                  "uct_constant": math.sqrt(2),
+                  "pw_constant": 4,
+                  "pw_exponent": 0.1,
+                  "batched_rollouts": False,
+                  "min_batched_rollouts": 512,
+                  "workers": 1,
+                  "seed": None,
+                  "checkpoint_interval": 0,
+                  "checkpoint_file": "",
+                  "resume": False,
+                  "exact_evaluation": False,
+                  "confidence_interval_width": None,
+                  "confidence_level": 0.95,
+                  "confidence_interval_min_samples": 30,
+                  "evaluation_batch_size": 1000,
                   "debug": False,
                   "output_graph": True,
                   "output_dot_file": "",
-                  "strategy_file": ""}
+                  "strategy_file": "",
+                  "prism_explicit": False,
+                  "evaluate_strategy_file": ""}
 
     # process arguments
     arguments(parameters)
@@ -388,6 +770,17 @@ def main():
     if parameters["debug"]:
         setup_logging()
 
+    # the search and the evaluation draw the seeds of their NumPy generators from random as well
+    if parameters["seed"] is not None:
+        random.seed(parameters["seed"])
+
+    if parameters["evaluate_strategy_file"] != "":
+        stats = init_statistics(parameters)
+        evaluate_binary_strategy(parameters, stats)
+        if parameters["evaluate_naive"]:
+            evaluate_naive(parameters, stats)
+        return
+
     start_time_mcts = time.time()
     graph, data, stats = mcts_outer(parameters)
     remove_unnecessary_nodes(graph)
@@ -403,11 +796,12 @@ def main():
 
     # Naive approach
     if parameters["evaluate_naive"]:
-        evaluate_naive(stats)
+        evaluate_naive(parameters, stats)
 
     # print stats
     print("Total simulations:", stats["total_simulations"])
     print("Graph size: ", len(graph.nodes) - 1)
+    print("Nodes explored: ", stats["frontier"].explored_count)
     print("Graph transitions: ", len(graph.edges) - len(stats["all_modes"]))
 
     # PRISM strategy
@@ -415,13 +809,17 @@ def main():
     end_time_prism = 0
     if not parameters["mcts_strategy"]:
         start_time_prism = time.time()
-        prism_state_to_state_mapping = export_prism_file(graph, parameters, stats)
+        if parameters["prism_explicit"]:
+            prism_state_to_state_mapping = export_prism_explicit_files(graph, parameters, stats)
+        else:
+            prism_state_to_state_mapping = export_prism_file(graph, parameters, stats)
         end_time_prism = time.time()
         evaluate_prism_strat.export_state_values(parameters, stats, prism_state_to_state_mapping)
         strategy, output_state_to_prism_state = \
             evaluate_prism_strat.generate_prism_strat(parameters,
                                                       stats,
                                                       prism_state_to_state_mapping)
+        write_binary_strategy(stats, strategy, parameters["binary_strategy_file"])
         if not parameters["initial_state_file"]:
             evaluate_prism_strat.evaluate_prism_strategy(parameters, stats, strategy)
 
@@ -1,59 +1,27 @@
 # Python built-in libraries
 import time
-import random
-
-# third-party libraries
-from tqdm import tqdm
 
 # project-specific libraries
-from evaluate_mcts_strategy import sample_a_defect, sample_initial_state
-from base import get_cost, check_useful_action
-from simulations import simulate_one_step_for_defect
-
-
-# noinspection DuplicatedCode
-def pick_best_available_action(statistics, state):
-    avail_actions = statistics["all_actions"]
-    useful_actions = []
-    for action in avail_actions:
-        if check_useful_action(statistics, state, action):
-            useful_actions.append(action)
-
-    if len(useful_actions) == 0:
-        return 0
-
-    i = random.randrange(len(useful_actions))
-    return useful_actions[i]
-
-
-def no_possible_successors(statistics, state):
-    for action in statistics["all_actions"]:
-        if check_useful_action(statistics, state, action):
-            return False
-    return True
+from evaluate_mcts_strategy import sample_defects, sample_initial_modes, evaluate_runs, \
+    print_average
+from base import get_action_matrix
+from simulations import simulate_batch
 
 
-def simulate_a_path(statistics, defect):
-    state = sample_initial_state(statistics, defect)
-    acc_cost = 0
-    while not no_possible_successors(statistics, state):
-        action = pick_best_available_action(statistics, state)
-        state = simulate_one_step_for_defect(statistics, state, action, defect)
-        acc_cost += get_cost(statistics, action)
-    return acc_cost
+# Run the naive strategy for a batch of sampled defects at once. Picking a random useful action
+# in every step is what the batched rollouts do as well
+def run_naive_batch(statistics, number_of_simulations, rng):
+    defects = sample_defects(statistics, number_of_simulations, rng)
+    initial_modes = sample_initial_modes(statistics, defects, rng)
+    costs = simulate_batch(statistics, get_action_matrix(statistics)[initial_modes], rng,
+                           statistics["number_of_equipments"] - 1 - defects)
+    return initial_modes, costs
 
 
 # noinspection DuplicatedCode
-def evaluate_naive(statistics):
+def evaluate_naive(parameters, statistics):
     max_num_simulations = 10000
-    total_cost = 0
-    defects = []
     print("\nStarting evaluation of naive strategy...")
     time.sleep(0.1)
-    for _ in tqdm(range(max_num_simulations)):
-        defect = sample_a_defect(statistics)
-        defects.append(defect)
-        cost = simulate_a_path(statistics, defect)
-        total_cost += cost
-    print("done")
-    print("Average cost for", max_num_simulations, "faults:", total_cost / max_num_simulations)
+    running = evaluate_runs(parameters, statistics, run_naive_batch, (), max_num_simulations)
+    print_average(parameters, running)
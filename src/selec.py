@@ -1,9 +1,10 @@
 # Python built-in libraries
+import math
 import random
 
 # project-specific libraries
-from base import check_useful_action, find_successors, find_successor_prob, get_cost, \
-    is_final_state, no_possible_successors
+from base import find_successors, find_successor_prob, get_cost, is_final_state, \
+    no_possible_successors, find_useful_action_indices
 
 
 def compute_cost(mcts_stats, statistics, state):
@@ -19,15 +20,47 @@ def compute_cost(mcts_stats, statistics, state):
     return cost
 
 
+# Successors and their probabilities of the (state, action) pairs in the search tree. They
+# never change, so they are computed only once
+def get_action_outcomes(statistics, state, action):
+    outcomes = statistics["action_outcomes"].get((state, action))
+    if outcomes is None:
+        outcomes = find_successors(statistics, state, action) \
+            + find_successor_prob(statistics, state, action)
+        statistics["action_outcomes"][(state, action)] = outcomes
+    return outcomes
+
+
 def compute_expected_cost_of_action(mcts_stats, statistics, state, action):
-    successors = find_successors(statistics, state, action)
-    prob = find_successor_prob(statistics, state, action)
+    successor1, successor2, prob1, prob2 = get_action_outcomes(statistics, state, action)
     cost = get_cost(statistics, action)
-    cost += (prob[0] * compute_cost(mcts_stats, statistics, successors[0]) +
-             prob[1] * compute_cost(mcts_stats, statistics, successors[1]))
+    cost += (prob1 * compute_cost(mcts_stats, statistics, successor1) +
+             prob2 * compute_cost(mcts_stats, statistics, successor2))
     return cost
 
 
+# Expected costs of (state, action) pairs are cached in statistics["q_values"].
+# statistics["q_dependents"] maps every successor to the pairs whose cached cost depends on it,
+# so that updating the successor's costs only drops those entries
+def get_q_value(mcts_stats, statistics, state, action):
+    if statistics["total_simulations"] == 0:
+        return compute_expected_cost_of_action(mcts_stats, statistics, state, action)
+    q_value = statistics["q_values"].get((state, action))
+    if q_value is None:
+        q_value = compute_expected_cost_of_action(mcts_stats, statistics, state, action)
+        statistics["q_values"][(state, action)] = q_value
+        for successor in get_action_outcomes(statistics, state, action)[:2]:
+            if statistics["q_dependents"].get(successor) is None:
+                statistics["q_dependents"][successor] = set()
+            statistics["q_dependents"][successor].add((state, action))
+    return q_value
+
+
+def invalidate_q_values(statistics, state):
+    for key in statistics["q_dependents"].pop(state, ()):
+        statistics["q_values"].pop(key, None)
+
+
 def simulate_one_step(statistics, state, action):
     rand = random.random()
     successors = find_successors(statistics, state, action)
@@ -40,60 +73,73 @@ def simulate_one_step(statistics, state, action):
 
 def get_useful_actions(statistics, state):
     if statistics["available_actions"].get(state) is None:
-        useful_actions = []
-        for action in statistics["all_actions"]:
-            if check_useful_action(statistics, state, action):
-                useful_actions.append(action)
-        statistics["available_actions"][state] = useful_actions
-        return useful_actions
-    else:
-        return statistics["available_actions"][state]
+        statistics["available_actions"][state] = find_useful_action_indices(statistics, state)
+    return statistics["available_actions"][state]
 
 
 def pick_random_action(statistics, state):
     useful_actions = get_useful_actions(statistics, state)
     i = random.randrange(len(useful_actions))
-    return useful_actions[i]
-
-
-def compute_action(statistics, from_state, to_state):
-    avail_actions = statistics["available_actions"][from_state]
-    for action in avail_actions:
-        successor1, successor2 = find_successors(statistics, from_state, action)
-        if successor1 == to_state or successor2 == to_state:
-            return action
-    print("Action not available ")
-    return 0
-
-
-def dfs(graph, statistics, from_state, to_state, path, action_path, visited):
-    if from_state == to_state:
-        return path, action_path
-    successors = list(graph.succ[from_state])
-    for successor in successors:
-        if successor in visited:
-            continue
-        visited.append(successor)
-        action = compute_action(statistics, from_state, successor)
-        new_path, new_action_path = dfs(graph, statistics, successor, to_state, path + [successor],
-                                        action_path + [action], visited)
-        if new_path:
-            return new_path, new_action_path
-    return [], []
-
-
-def compute_state_action_paths(mcts_graph, statistics, from_state, to_state):
-    path = [from_state]
+    return statistics["all_actions"][useful_actions[i]]
+
+
+# Follow the parent pointers set in mcts_trim from the selected state back to init_node
+def compute_state_action_paths(statistics, from_state, to_state):
+    path = [to_state]
     action_path = []
-    visited = [from_state]
-    return dfs(mcts_graph, statistics, from_state, to_state, path, action_path, visited)
+    state = to_state
+    while state != from_state:
+        state, action = statistics["parents"][state]
+        path.append(state)
+        action_path.append(action)
+    path.reverse()
+    action_path.reverse()
+    return path, action_path
+
+
+# Selection policies pick the state of the frontier that is expanded next
+def select_random(mcts_stats, statistics, parameters, init_node):
+    return statistics["frontier"].pick_random()
 
 
-def mcts_select(mcts_graph, statistics, init_node):
-    i = random.randrange(len(statistics["nodes_to_explore"]))
-    selected_state = statistics["nodes_to_explore"][i]
-    path, action_path = compute_state_action_paths(mcts_graph,
-                                                   statistics,
-                                                   init_node,
-                                                   selected_state)
+def get_max_action_cost(statistics):
+    if statistics.get("max_action_cost") is None:
+        statistics["max_action_cost"] = max(statistics["all_actions_cost"].values())
+    return statistics["max_action_cost"]
+
+
+# UCB1 for costs: the mean cost is scaled by the highest action cost and negated, the exploration
+# term uses the visits of the state and of the parent it was queued from
+def compute_ucb(mcts_stats, statistics, parameters, state):
+    num_visited = mcts_stats[state][1]
+    if num_visited == 0:
+        return math.inf
+    parent = statistics["parents"].get(state)
+    parent_visited = mcts_stats[parent[0]][1] if parent is not None else num_visited
+    mean_cost = mcts_stats[state][0] / num_visited / get_max_action_cost(statistics)
+    return -mean_cost + parameters["uct_constant"] * math.sqrt(math.log(max(parent_visited, 1))
+                                                               / num_visited)
+
+
+# Walk down from init_node to the first queued state, following the child with the highest UCB1
+# among the children that have queued states below them
+def select_uct(mcts_stats, statistics, parameters, init_node):
+    frontier = statistics["frontier"]
+    state = init_node
+    while state not in frontier.nodes_to_explore:
+        state = max(frontier.open_children(state),
+                    key=lambda child: compute_ucb(mcts_stats, statistics, parameters, child))
+    return state
+
+
+# pw selects like uct, the actions are widened in mcts_expand and reopen_widened_states
+selection_policies = {"random": select_random,
+                      "uct": select_uct,
+                      "pw": select_uct}
+
+
+def mcts_select(mcts_graph, mcts_stats, statistics, parameters, init_node):
+    selected_state = selection_policies[parameters["selection_policy"]](mcts_stats, statistics,
+                                                                        parameters, init_node)
+    path, action_path = compute_state_action_paths(statistics, init_node, selected_state)
     return selected_state, path, action_path
@@ -2,10 +2,16 @@
 import math
 import random
 
+# third-party libraries
+import numpy as np
+
 # project-specific libraries
-from expand import find_useful_actions
-from selec import pick_random_action, simulate_one_step
-from base import get_cost, int_to_list, find_successors, no_possible_successors
+from expand import find_useful_actions, find_useful_actions_frontier
+from selec import pick_random_action, simulate_one_step, invalidate_q_values
+from base import get_cost, find_successors, no_possible_successors, has_equipment, \
+    get_action_matrix, get_action_costs, get_bit_fail_probabilities, mask_to_words, words_to_mask, \
+    words_to_bits, sample_defect_in_state, sample_defects_in_state, \
+    find_useful_action_indices_batch
 
 
 def simulate_default(statistics, state):
@@ -21,7 +27,8 @@ def simulate_default(statistics, state):
     return acc_cost
 
 
-def update_state_costs(mcts_stats, state, cost):
+def update_state_costs(mcts_stats, statistics, state, cost):
+    invalidate_q_values(statistics, state)
     if mcts_stats[state] is not None \
             and mcts_stats[state][0] != math.inf \
             and mcts_stats[state][0] != -1 * math.inf:
@@ -33,42 +40,16 @@ def update_state_costs(mcts_stats, state, cost):
 
 
 def mcts_back_propagate(mcts_stats, statistics, path, action_path, cost):
-    mcts_stats = update_state_costs(mcts_stats, path[len(path) - 1], cost)
+    mcts_stats = update_state_costs(mcts_stats, statistics, path[len(path) - 1], cost)
     for i in range(len(path) - 2, -1, -1):
         cost += get_cost(statistics, action_path[i])
-        mcts_stats = update_state_costs(mcts_stats, path[i], cost)
+        mcts_stats = update_state_costs(mcts_stats, statistics, path[i], cost)
     return mcts_stats
 
 
-def get_defect_distribution(statistics, state):
-    state_vector = int_to_list(statistics, state)
-    length = len(state_vector)
-    sum_prob = 0
-    for i in range(length):
-        if state_vector[i] == 1:
-            sum_prob += statistics["equipment_fault_probabilities"][i]
-    distribution = []
-    for i in range(length):
-        if state_vector[i] == 1:
-            distribution.append(statistics["equipment_fault_probabilities"][i] / sum_prob)
-        else:
-            distribution.append(0)
-    return distribution
-
-
-def sample_a_defect(distribution):
-    rand = random.random()
-    i = 0
-    while distribution[i] < rand:
-        rand -= distribution[i]
-        i += 1
-    return i
-
-
 def simulate_one_step_for_defect(statistics, state, action, defect):
     successor1, successor2 = find_successors(statistics, state, action)
-    successor1_list = int_to_list(statistics, successor1)
-    if successor1_list[defect] == 1:
+    if has_equipment(statistics, successor1, defect):
         return successor1
     else:
         return successor2
@@ -87,14 +68,156 @@ def simulate_type_one(statistics, state, defect_equip_index):
     return acc_cost
 
 
+def update_state_costs_batch(mcts_stats, statistics, state, total_cost, visits):
+    invalidate_q_values(statistics, state)
+    if mcts_stats[state] is not None \
+            and mcts_stats[state][0] != math.inf \
+            and mcts_stats[state][0] != -1 * math.inf:
+        mcts_stats[state][0] += total_cost
+        mcts_stats[state][1] += visits
+    else:
+        mcts_stats[state] = [total_cost, visits]
+    return mcts_stats
+
+
+# Apply the costs of many rollouts at once. new_states and actions hold the first step of every
+# rollout, costs the cost of each rollout from its new state onwards
+def mcts_back_propagate_batch(mcts_stats, statistics, path, action_path, new_states, actions,
+                              costs):
+    if len(new_states) == 0:
+        return mcts_stats
+    unique_states, inverse = np.unique(np.array(new_states, dtype=object), return_inverse=True)
+    new_state_costs = np.bincount(inverse, weights=costs)
+    new_state_visits = np.bincount(inverse)
+    for new_state, total_cost, visits in zip(unique_states, new_state_costs, new_state_visits):
+        mcts_stats = update_state_costs_batch(mcts_stats, statistics, new_state,
+                                              float(total_cost), int(visits))
+    visits = len(new_states)
+    cost = float(np.sum(costs)) + sum(get_cost(statistics, action) for action in actions)
+    mcts_stats = update_state_costs_batch(mcts_stats, statistics, path[len(path) - 1], cost,
+                                          visits)
+    for i in range(len(path) - 2, -1, -1):
+        cost += visits * get_cost(statistics, action_path[i])
+        mcts_stats = update_state_costs_batch(mcts_stats, statistics, path[i], cost, visits)
+    return mcts_stats
+
+
+# NumPy generator for the batched rollouts, seeded from random to keep runs reproducible
+def get_rng(statistics):
+    if statistics.get("rng") is None:
+        statistics["rng"] = np.random.default_rng(random.getrandbits(64))
+    return statistics["rng"]
+
+
+# Pick one action uniformly at random for every row of states_words from the available_actions
+# of its state, like pick_random_action does. The actions are looked up once per distinct state,
+# and states without an entry get their useful actions stored like in the sequential rollouts.
+# Returns the action indices and whether a row had an action at all
+def pick_random_actions_batch(statistics, states_words, rng):
+    unique_words, inverse = np.unique(states_words, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    unique_states = [words_to_mask(words) for words in unique_words]
+    if statistics.get("available_actions") is None:
+        # Outside of the search, e.g. in the naive evaluation, every useful action may be picked
+        action_lists = find_useful_action_indices_batch(statistics, unique_states)
+    else:
+        find_useful_actions_frontier(statistics, unique_states)
+        action_lists = [statistics["available_actions"][state] for state in unique_states]
+    counts = np.array([len(action_list) for action_list in action_lists], dtype=np.int64)
+    offsets = np.cumsum(counts) - counts
+    all_indices = np.concatenate([np.asarray(action_list, dtype=np.int64)
+                                  for action_list in action_lists])
+    picks = (rng.random(len(states_words)) * counts[inverse]).astype(np.int64)
+    has_actions = counts[inverse] > 0
+    rows = np.flatnonzero(has_actions)
+    action_indices = np.zeros(len(states_words), dtype=np.int64)
+    action_indices[rows] = all_indices[offsets[inverse[rows]] + picks[rows]]
+    return action_indices, has_actions
+
+
+def simulate_one_step_batch(statistics, states_words, action_indices, rng, defect_bits=None):
+    actions_words = get_action_matrix(statistics)[action_indices]
+    successors1 = states_words & ~actions_words  # action works
+    successors2 = states_words & actions_words  # action doesn't work
+    if defect_bits is None:
+        bit_fail_probabilities = np.array(get_bit_fail_probabilities(statistics))
+        prob1 = words_to_bits(statistics, successors1) @ bit_fail_probabilities
+        prob2 = words_to_bits(statistics, successors2) @ bit_fail_probabilities
+        total = prob1 + prob2
+        prob1 = np.divide(prob1, total, out=np.zeros_like(prob1), where=total > 0)
+        works = rng.random(len(states_words)) < prob1
+    else:
+        # The action works if the defect is not part of it, i.e. it stays in successor1
+        defect_words = successors1[np.arange(len(states_words)), defect_bits // 64]
+        works = (defect_words >> (defect_bits % 64).astype(np.uint64)) & np.uint64(1) == 1
+    return np.where(works[:, None], successors1, successors2)
+
+
+# Run all rollouts with the random policy in lockstep until none of them has a useful action left
+def simulate_batch(statistics, states_words, rng, defect_bits=None):
+    action_costs = get_action_costs(statistics)
+    states_words = states_words.copy()
+    costs = np.zeros(len(states_words))
+    active = np.arange(len(states_words))
+    while len(active):
+        action_indices, has_actions = pick_random_actions_batch(statistics, states_words[active],
+                                                                rng)
+        active = active[has_actions]
+        action_indices = action_indices[has_actions]
+        states_words[active] = simulate_one_step_batch(
+            statistics, states_words[active], action_indices, rng,
+            None if defect_bits is None else defect_bits[active])
+        costs[active] += action_costs[action_indices]
+    return costs
+
+
+def sample_defect_bits(statistics, state, size, rng):
+    defects = sample_defects_in_state(statistics, state, size, rng)
+    return statistics["number_of_equipments"] - 1 - defects
+
+
+def mcts_simulate_batch(mcts_stats, statistics, parameters, state, path, action_path, max_sim):
+    if max_sim == 0:
+        return 0
+    rng = get_rng(statistics)
+    states_words = np.tile(mask_to_words(statistics, state), (max_sim, 1))
+    defect_bits = None
+    if parameters["sampling_type"] == 1:
+        defect_bits = sample_defect_bits(statistics, state, max_sim, rng)
+    action_indices, _ = pick_random_actions_batch(statistics, states_words, rng)
+    new_states_words = simulate_one_step_batch(statistics, states_words, action_indices, rng,
+                                               defect_bits)
+    unique_words, inverse = np.unique(new_states_words, axis=0, return_inverse=True)
+    unique_states = [words_to_mask(words) for words in unique_words]
+    new_states = [unique_states[i] for i in inverse.reshape(-1)]
+    if parameters["sampling_type"] == 0:
+        # Like the sequential rollouts, do not simulate from states that have been explored
+        keep = np.array([not statistics["frontier"].is_explored(new_state)
+                         for new_state in unique_states], dtype=bool)[inverse.reshape(-1)]
+    else:
+        keep = np.ones(max_sim, dtype=bool)
+    costs = simulate_batch(statistics, new_states_words[keep], rng,
+                           None if defect_bits is None else defect_bits[keep])
+    actions = [statistics["all_actions"][i] for i in action_indices[keep]]
+    mcts_stats = mcts_back_propagate_batch(mcts_stats, statistics, path, action_path,
+                                           [new_states[i] for i in np.flatnonzero(keep)],
+                                           actions, costs)
+    return int(keep.sum())
+
+
+# Expansions with fewer rollouts than parameters["min_batched_rollouts"] run them one by one even
+# with batched rollouts, as the NumPy overhead outweighs the gain for small batches
 def mcts_simulate(mcts_stats, statistics, parameters, state, path, action_path, max_sim):
+    if parameters["batched_rollouts"] and max_sim >= parameters["min_batched_rollouts"]:
+        return mcts_simulate_batch(mcts_stats, statistics, parameters, state, path, action_path,
+                                   max_sim)
     num_sim = 0
     i = 0
     if parameters["sampling_type"] == 0:
         while i < max_sim:
             action = pick_random_action(statistics, state)
             new_state = simulate_one_step(statistics, state, action)
-            if new_state in statistics["nodes_explored"]:
+            if statistics["frontier"].is_explored(new_state):
                 i += 1
                 continue
             new_path = path + [new_state]
@@ -107,8 +230,7 @@ def mcts_simulate(mcts_stats, statistics, parameters, state, path, action_path,
         return num_sim
     elif parameters["sampling_type"] == 1:
         while i < max_sim:
-            distribution = get_defect_distribution(statistics, state)
-            defect_equip_index = sample_a_defect(distribution)
+            defect_equip_index = sample_defect_in_state(statistics, state)
             action = pick_random_action(statistics, state)
             new_state = simulate_one_step_for_defect(statistics, state, action, defect_equip_index)
             new_path = path + [new_state]
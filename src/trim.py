@@ -1,4 +1,5 @@
 # Python built-in libraries
+import heapq
 import logging
 
 # third-party libraries
@@ -6,8 +7,8 @@ import networkx as nx
 
 # project-specific libraries
 from expand import add_edge
-from selec import compute_expected_cost_of_action
-from base import find_successors
+from selec import get_q_value
+from base import find_successors, get_available_actions
 
 
 def delete_edges(mcts_graph, statistics, state, action):
@@ -24,64 +25,57 @@ def delete_edges(mcts_graph, statistics, state, action):
     return mcts_graph
 
 
-def find_max_cost(list_cost):
-    max_cost = list_cost[0]
-    max_cost_index = 0
-    length = len(list_cost)
-    for i in range(length):
-        if list_cost[i] > max_cost:
-            max_cost = list_cost[i]
-            max_cost_index = i
-    return max_cost, max_cost_index
-
-
+# Indices of the k lowest costs. The first k costs fill k slots, every later cost that is lower
+# than the highest cost in the slots replaces it, the first of several highest slots on ties. The
+# slots are kept in a heap ordered by (highest cost, first slot), so that the result, in slot
+# order, is the same as rescanning the slots for their maximum
 def find_best_k_action_indices(list_costs, k):
-    best_costs = list_costs[0:k]
-    best_indices = list(range(k))
+    k = min(k, len(list_costs))
+    heap = [(-list_costs[i], i, i) for i in range(k)]  # (negated cost, slot, index)
+    heapq.heapify(heap)
     for i in range(k, len(list_costs)):
-        max_cost, max_cost_index = find_max_cost(best_costs)
-        if max_cost > list_costs[i]:
-            best_costs[max_cost_index] = list_costs[i]
-            best_indices[max_cost_index] = i
-    return best_indices
+        if -heap[0][0] > list_costs[i]:
+            heapq.heapreplace(heap, (-list_costs[i], heap[0][1], i))
+    return [index for _, _, index in sorted(heap, key=lambda entry: entry[1])]
 
 
-def find_best_k_actions(mcts_data, statistics, parameters, state):
-    available_actions = statistics["available_actions"][state]
-    available_actions_cost = []
+# Indices of all costs that are at most margin above the lowest cost, lowest cost first
+def find_action_indices_within_margin(list_costs, margin):
+    best_cost = min(list_costs)
+    return sorted([i for i in range(len(list_costs)) if list_costs[i] <= best_cost + margin],
+                  key=lambda i: (list_costs[i], i))
 
-    for action in available_actions:
-        available_actions_cost.append(
-            compute_expected_cost_of_action(mcts_data, statistics, state, action))
 
-    best_action_indices = find_best_k_action_indices(available_actions_cost,
-                                                     parameters["successors_to_keep"])
+def find_best_action_indices(list_costs, parameters):
+    if parameters["cost_margin"] is not None:
+        return find_action_indices_within_margin(list_costs, parameters["cost_margin"])
+    return find_best_k_action_indices(list_costs, parameters["successors_to_keep"])
 
-    best_k_actions = []
-    for i in best_action_indices:
-        best_k_actions.append(available_actions[i])
 
-    return best_k_actions
+# Queue a successor for exploration and remember the edge it was reached through, so that
+# mcts_select can walk back to the initial state
+def add_to_frontier(statistics, state, action, successor):
+    if statistics["frontier"].add(successor, state):
+        statistics["parents"][successor] = (state, action)
 
 
 def mcts_trim(mcts_graph, mcts_data, statistics, parameters, state):
-    available_actions = statistics["available_actions"][state]
+    available_action_indices = statistics["available_actions"][state]
+    available_actions = get_available_actions(statistics, state)
 
-    if len(available_actions) < parameters["successors_to_keep"] \
-            or parameters["successors_to_keep"] == 0:
+    if parameters["successors_to_keep"] == 0 \
+            or (len(available_actions) < parameters["successors_to_keep"]
+                and parameters["cost_margin"] is None):
         best_actions = available_actions
+        best_action_indices = available_action_indices
         for action in best_actions:
             successor1, successor2 = find_successors(statistics, state, action)
-            if successor1 not in statistics["nodes_to_explore"] \
-                    and successor1 not in statistics["nodes_explored"]:
-                statistics["nodes_to_explore"].append(successor1)
-            if successor2 not in statistics["nodes_to_explore"] \
-                    and successor2 not in statistics["nodes_explored"]:
-                statistics["nodes_to_explore"].append(successor2)
+            add_to_frontier(statistics, state, action, successor1)
+            add_to_frontier(statistics, state, action, successor2)
     else:
         available_action_costs = []
         for action in available_actions:
-            cost = compute_expected_cost_of_action(mcts_data, statistics, state, action)
+            cost = get_q_value(mcts_data, statistics, state, action)
             available_action_costs.append(cost)
 
         if parameters["debug"]:
@@ -90,25 +84,24 @@ def mcts_trim(mcts_graph, mcts_data, statistics, parameters, state):
             for x, y in zip(available_actions, available_action_costs):
                 temp += str(x) + " : " + str(round(y, 1)) + ","
             logging.debug(temp)
-        best_actions = find_best_k_actions(mcts_data, statistics, parameters, state)
+        best_positions = find_best_action_indices(available_action_costs, parameters)
+        best_actions = [available_actions[i] for i in best_positions]
         if parameters["debug"]:
             logging.debug("Best actions: " + ' '.join(map(str, best_actions)) + "\n")
 
+        best_action_indices = available_action_indices[best_positions]
+        best_action_set = set(best_actions)
         for action in available_actions:
-            if action not in best_actions:
+            if action not in best_action_set:
                 delete_edges(mcts_graph, statistics, state, action)
 
         for action in best_actions:
             successor1, successor2 = find_successors(statistics, state, action)
             add_edge(mcts_graph, state, successor1)
             add_edge(mcts_graph, state, successor2)
-            if successor1 not in statistics["nodes_to_explore"] \
-                    and successor1 not in statistics["nodes_explored"]:
-                statistics["nodes_to_explore"].append(successor1)
-            if successor2 not in statistics["nodes_to_explore"] \
-                    and successor2 not in statistics["nodes_explored"]:
-                statistics["nodes_to_explore"].append(successor2)
+            add_to_frontier(statistics, state, action, successor1)
+            add_to_frontier(statistics, state, action, successor2)
 
 
-    statistics["available_actions"][state] = best_actions
+    statistics["available_actions"][state] = best_action_indices
     return mcts_graph